@@ -0,0 +1,19 @@
+import json
+import os
+
+from sqlite_cache import SqliteCache
+from storage import cache_dir, content_hash, singleton
+
+# Answers are kept until evicted unless DATACHAT_ANSWER_TTL (seconds) is set
+ANSWER_TTL = float(os.environ["DATACHAT_ANSWER_TTL"]) if os.environ.get("DATACHAT_ANSWER_TTL") else None
+MAX_ANSWERS = 5000
+
+
+def answer_key(document_hash, query, model, **chain_settings):
+    return content_hash(document_hash, query, model, json.dumps(chain_settings, sort_keys=True))
+
+
+def get_answer_cache():
+    return singleton("answer_cache", lambda: SqliteCache(
+        os.path.join(cache_dir("answers"), "answers.sqlite"), max_entries=MAX_ANSWERS, ttl=ANSWER_TTL
+    ))
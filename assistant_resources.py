@@ -0,0 +1,167 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+from storage import content_hash, singleton
+
+# Remote objects unused for this long are deleted by the cleanup pass, which
+# runs at most once per CLEANUP_INTERVAL
+STALE_AFTER = 6 * 60 * 60
+CLEANUP_INTERVAL = 15 * 60
+
+# Untracked assistants found remotely may belong to another live process, so
+# they are only deleted after a much longer idle period
+REMOTE_ASSISTANT_GRACE = 7 * 24 * 60 * 60
+
+# Tag on every assistant this app creates, so the cleanup pass can also find
+# the ones left behind by earlier processes
+APP_METADATA = {"created_by": "datachat"}
+
+
+class AssistantResources:
+    """Process-wide cache of uploaded files, assistants and threads on the Assistants API.
+
+    Files are keyed by content hash and assistants by model and instructions,
+    so every session reuses them; threads belong to one session each.
+    """
+
+    def __init__(self, stale_after=STALE_AFTER, cleanup_interval=CLEANUP_INTERVAL,
+                 remote_grace=REMOTE_ASSISTANT_GRACE):
+        self.stale_after = stale_after
+        self.cleanup_interval = cleanup_interval
+        self.remote_grace = remote_grace
+        self._files = {}
+        self._assistants = {}
+        self._threads = {}
+        # Uploads and assistant creations in progress, keyed by kind and cache key
+        self._pending = {}
+        self._last_cleanup = time.time()
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, kind, cache, key, create, metric=None):
+        """Cached id for ``key``, else the id ``create()`` returns.
+
+        Remote calls run outside the lock, so cache hits and other keys are
+        not held up; concurrent callers for one key wait for a single call.
+        """
+        with self._lock:
+            entry = cache.get(key)
+            if metric:
+                metrics.cache_result(metric, entry is not None)
+            if entry is not None:
+                entry["last_used"] = time.time()
+                return entry["id"]
+            pending = self._pending.get((kind, key))
+            creating = pending is None
+            if creating:
+                pending = self._pending[(kind, key)] = Future()
+        if not creating:
+            return pending.result()
+
+        try:
+            object_id = create()
+        except Exception as e:
+            with self._lock:
+                del self._pending[(kind, key)]
+            pending.set_exception(e)
+            raise
+        with self._lock:
+            cache[key] = {"id": object_id, "last_used": time.time()}
+            del self._pending[(kind, key)]
+        pending.set_result(object_id)
+        return object_id
+
+    def file_id(self, client, name, data):
+        def upload():
+            with metrics.span("assistant_upload"):
+                # The SDK wants bytes; buffers are only copied when actually uploading
+                return client.files.create(file=(name, bytes(data)), purpose="assistants").id
+
+        key = (client.api_key, content_hash(data))
+        return self._get_or_create("file", self._files, key, upload, metric="assistant_file")
+
+    def assistant_id(self, client, model, instructions, tools=({"type": "code_interpreter"},)):
+        def create():
+            return client.beta.assistants.create(
+                name="Data Analyst Assistant",
+                instructions=instructions,
+                model=model,
+                tools=list(tools),
+                metadata=APP_METADATA,
+            ).id
+
+        return self._get_or_create("assistant", self._assistants, (client.api_key, model, instructions), create)
+
+    def thread_id(self, client, file_id, current=None):
+        """Return ``current`` while it is still alive for ``file_id``, else a new thread id."""
+        with self._lock:
+            entry = self._threads.get(current)
+            alive = entry is not None and entry["file_id"] == file_id
+        if not alive:
+            # Threads belong to one session, so there is nothing to share while creating one
+            thread = client.beta.threads.create(
+                tool_resources={"code_interpreter": {"file_ids": [file_id]}},
+            )
+            current = thread.id
+        with self._lock:
+            entry = self._threads.setdefault(current, {"api_key": client.api_key, "file_id": file_id})
+            entry["last_used"] = time.time()
+            # A live thread keeps its file alive too
+            for (api_key, _), file_entry in self._files.items():
+                if api_key == client.api_key and file_entry["id"] == file_id:
+                    file_entry["last_used"] = entry["last_used"]
+            return current
+
+    def discard(self, *object_ids):
+        """Forget cached files, assistants or threads that no longer exist remotely."""
+        with self._lock:
+            for cache in (self._files, self._assistants, self._threads):
+                for key, entry in list(cache.items()):
+                    if entry.get("id", key) in object_ids:
+                        del cache[key]
+
+    def cleanup(self, client, force=False):
+        """Delete remote threads, files and assistants unused for ``stale_after`` seconds."""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_cleanup < self.cleanup_interval:
+                return
+            self._last_cleanup = now
+            cutoff = now - self.stale_after
+            stale_threads = [tid for tid, e in self._threads.items()
+                             if e["api_key"] == client.api_key and e["last_used"] < cutoff]
+            stale_files = [key for key, e in self._files.items()
+                           if key[0] == client.api_key and e["last_used"] < cutoff]
+            stale_assistants = [key for key, e in self._assistants.items()
+                                if key[0] == client.api_key and e["last_used"] < cutoff]
+            for thread_id in stale_threads:
+                del self._threads[thread_id]
+            file_ids = [self._files.pop(key)["id"] for key in stale_files]
+            assistant_ids = {self._assistants.pop(key)["id"] for key in stale_assistants}
+            live_assistant_ids = {e["id"] for e in self._assistants.values()}
+
+        # Assistants left behind by earlier processes are only known remotely
+        remote_cutoff = now - max(self.stale_after, self.remote_grace)
+        try:
+            for assistant in client.beta.assistants.list(limit=100):
+                if (assistant.metadata or {}).get("created_by") == APP_METADATA["created_by"] \
+                        and assistant.created_at < remote_cutoff and assistant.id not in live_assistant_ids:
+                    assistant_ids.add(assistant.id)
+        except Exception:
+            # Listing is best effort; the tracked objects are still cleaned up
+            pass
+
+        for delete, ids in ((client.beta.threads.delete, stale_threads),
+                            (client.files.delete, file_ids),
+                            (client.beta.assistants.delete, assistant_ids)):
+            for object_id in ids:
+                try:
+                    delete(object_id)
+                except Exception:
+                    # Already gone remotely; nothing left to clean up
+                    pass
+
+
+def get_assistant_resources():
+    return singleton("assistant_resources", AssistantResources)
@@ -0,0 +1,159 @@
+"""Running Assistants API requests with streamed output.
+
+Runs are streamed so text deltas and generated images reach the page as they
+arrive. If the stream cannot be opened (older SDKs, proxies or fake servers
+without SSE support) the run is created normally and polled with adaptive
+backoff. The client honours OPENAI_BASE_URL, so a local fake server can stand
+in for the API.
+"""
+import os
+import time
+
+import openai
+
+import metrics
+
+# Overall limit for one run, and the polling backoff used without streaming
+RUN_TIMEOUT = float(os.environ.get("DATACHAT_RUN_TIMEOUT", 300))
+POLL_INITIAL = 0.5
+POLL_MAX = 5.0
+POLL_FACTOR = 1.5
+
+FAILED_STATUSES = ("failed", "cancelled", "expired", "incomplete")
+FAILED_EVENTS = tuple(f"thread.run.{status}" for status in FAILED_STATUSES)
+
+
+def _cancel(client, thread_id, run_id):
+    try:
+        client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+    except Exception:
+        # The run may have finished meanwhile
+        pass
+
+
+def _timeout_result(timeout):
+    return [{"type": "error", "value": f"Run did not finish within {timeout:.0f} seconds"}]
+
+
+def stream_run(client, thread_id, assistant_id, instructions, on_text=None, on_image=None, timeout=RUN_TIMEOUT,
+               run_info=None):
+    """Run the assistant and stream its output.
+
+    ``on_text(key, text)`` is called with the full text so far of each
+    message part, ``on_image(image_bytes)`` once per generated image.
+    The run id is stored in ``run_info["id"]`` as soon as it is known.
+    Returns the final results in the same shape as poll_run.
+    """
+    deadline = time.monotonic() + timeout
+    parts = {}
+    run_id = None
+    run_info = {} if run_info is None else run_info
+
+    with client.beta.threads.runs.stream(
+        thread_id=thread_id,
+        assistant_id=assistant_id,
+        instructions=instructions,
+        timeout=timeout,
+    ) as stream:
+        for event in stream:
+            if event.event == "thread.run.created":
+                run_id = run_info["id"] = event.data.id
+            elif event.event == "thread.message.delta":
+                for content in event.data.delta.content or []:
+                    key = (event.data.id, content.index)
+                    if content.type == "text" and content.text and content.text.value:
+                        part = parts.setdefault(key, {"type": "text", "value": ""})
+                        part["value"] += content.text.value
+                        if on_text:
+                            on_text(key, part["value"])
+                    elif content.type == "image_file" and content.image_file and key not in parts:
+                        image_bytes = client.files.content(content.image_file.file_id).read()
+                        parts[key] = {"type": "image", "value": image_bytes}
+                        if on_image:
+                            on_image(image_bytes)
+            elif event.event in FAILED_EVENTS:
+                return [{"type": "error", "value": f"Run ended with status: {event.data.status}"}]
+
+            if time.monotonic() > deadline:
+                if run_id:
+                    _cancel(client, thread_id, run_id)
+                return _timeout_result(timeout)
+
+    return list(parts.values())
+
+
+def poll_run(client, thread_id, assistant_id, instructions, on_text=None, on_image=None, timeout=RUN_TIMEOUT,
+             run_id=None):
+    """Create the run (unless ``run_id`` is given) and poll it with growing intervals until it finishes."""
+    if run_id is None:
+        run_id = client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            instructions=instructions,
+        ).id
+
+    deadline = time.monotonic() + timeout
+    delay = POLL_INITIAL
+    while True:
+        run_status = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        metrics.count("assistant_polls")
+
+        if run_status.status == "completed":
+            break
+        elif run_status.status in FAILED_STATUSES:
+            return [{"type": "error", "value": f"Run ended with status: {run_status.status}"}]
+        elif time.monotonic() + delay > deadline:
+            _cancel(client, thread_id, run_id)
+            return _timeout_result(timeout)
+
+        time.sleep(delay)
+        delay = min(delay * POLL_FACTOR, POLL_MAX)
+
+    # Process completed results; earlier turns of the thread are already shown
+    messages = client.beta.threads.messages.list(thread_id=thread_id, run_id=run_id, order="asc")
+    results = []
+    for message in messages:
+        for index, content in enumerate(message.content):
+            if content.type == "text":
+                results.append({"type": "text", "value": content.text.value})
+                if on_text:
+                    on_text((message.id, index), content.text.value)
+
+            elif content.type == "image_file":
+                # Process image content in memory
+                image_data = client.files.content(content.image_file.file_id)
+                image_bytes = image_data.read()
+                results.append({"type": "image", "value": image_bytes})
+                if on_image:
+                    on_image(image_bytes)
+    return results
+
+
+def run_assistant(client, thread_id, assistant_id, instructions, on_text=None, on_image=None, timeout=RUN_TIMEOUT):
+    """Stream the run when possible, otherwise fall back to polling."""
+    streamed_anything = []
+
+    def track_text(key, text):
+        streamed_anything.append(key)
+        if on_text:
+            on_text(key, text)
+
+    def track_image(image_bytes):
+        streamed_anything.append(None)
+        if on_image:
+            on_image(image_bytes)
+
+    run_info = {}
+    try:
+        with metrics.span("assistant_run", mode="stream"):
+            return stream_run(client, thread_id, assistant_id, instructions, track_text, track_image, timeout, run_info)
+    except openai.NotFoundError:
+        # The thread or assistant is gone; polling would fail the same way
+        raise
+    except Exception:
+        # Only fall back if nothing reached the page yet, otherwise output would repeat
+        if streamed_anything:
+            raise
+    # A run that was already started by the stream is polled rather than started twice
+    with metrics.span("assistant_run", mode="poll"):
+        return poll_run(client, thread_id, assistant_id, instructions, on_text, on_image, timeout, run_info.get("id"))
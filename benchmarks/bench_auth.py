@@ -0,0 +1,100 @@
+"""Concurrent login load benchmark for the user store.
+
+Seeds a throwaway users.db, then fires logins from many threads the way a
+shift-start burst would, followed by a burst of concurrent signups, and
+prints a JSON summary of throughput, latency percentiles and how many
+requests were refused as busy for each.
+
+    python benchmarks/bench_auth.py --users 300 --threads 32
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt  # noqa: E402
+
+import user_store  # noqa: E402
+
+
+def _summary(benchmark, results, elapsed, threads):
+    latencies = sorted(latency for _, latency in results)
+    statuses = [status for status, _ in results]
+    return {
+        "benchmark": benchmark,
+        "users": len(results),
+        "threads": threads,
+        "seconds": round(elapsed, 4),
+        "requests_per_second": round(len(results) / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000, 2),
+        "success": statuses.count("success"),
+        "busy": statuses.count("busy"),
+        "errors": len(statuses) - statuses.count("success") - statuses.count("busy"),
+    }
+
+
+def run_signups(users=100, threads=32):
+    """Concurrent signups: hash_password at the default bcrypt cost plus add_user."""
+    store = user_store.get_user_store()
+
+    def signup(i):
+        start = time.perf_counter()
+        try:
+            hashed = user_store.hash_password("password")
+            status = "success" if store.add_user(f"new{i}", f"new{i}@example.com", hashed) else "error"
+        except user_store.ServerBusy:
+            status = "busy"
+        return status, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(signup, range(users)))
+    return _summary("auth_concurrent_signup", results, time.perf_counter() - start, threads)
+
+
+def run(users=300, threads=32, rounds=12):
+    os.chdir(tempfile.mkdtemp())
+    store = user_store.get_user_store()
+
+    # One hash shared by every seeded user keeps seeding fast while each
+    # login still pays the full bcrypt cost
+    hashed = bcrypt.hashpw(b"password", bcrypt.gensalt(rounds)).decode("utf-8")
+    for i in range(users):
+        store.add_user(f"user{i}", f"user{i}@example.com", hashed)
+
+    def login(i):
+        start = time.perf_counter()
+        status, _ = user_store.validate_user(f"user{i}@example.com", "password")
+        return status, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(login, range(users)))
+    elapsed = time.perf_counter() - start
+
+    summary = _summary("auth_concurrent_login", results, elapsed, threads)
+    summary["bcrypt_rounds"] = rounds
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--signups", type=int, default=100)
+    args = parser.parse_args()
+    print(json.dumps(run(args.users, args.threads, args.rounds)))
+    if args.signups:
+        print(json.dumps(run_signups(args.signups, args.threads)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Cold-start and per-rerun timing for page loading.
+
+Reports, as JSON:
+- the import cost of what main.py needs before the home page can render, and
+  whether any heavy page dependency was pulled in by it;
+- per-rerun cost of the old read+compile path versus the page registry for
+  every page script.
+
+    python benchmarks/bench_pages.py --reruns 50
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from page_registry import PageRegistry  # noqa: E402
+
+PAGES = ["business", "teacher", "teacher_assistant"]
+HEAVY_MODULES = ["langchain", "langchain_core", "langchain_community", "langchain_openai", "faiss", "fitz", "pandas", "openai"]
+
+COLD_START = """
+import json, sys, time
+start = time.perf_counter()
+import email_validator, metrics, page_registry, user_store
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "heavy_loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def cold_start():
+    output = subprocess.run(
+        [sys.executable, "-c", COLD_START], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output)
+    return {"benchmark": "home_cold_start", "seconds": round(result["seconds"], 4),
+            "heavy_loaded": result["heavy_loaded"]}
+
+
+def per_rerun(reruns):
+    registry = PageRegistry(page_dirs=(os.path.join(ROOT, "pages"), ROOT))
+    results = []
+    for name in PAGES:
+        path = registry.resolve(name)
+        if path is None:
+            continue
+
+        start = time.perf_counter()
+        for _ in range(reruns):
+            with open(path, encoding="utf-8") as f:
+                compile(f.read(), path, "exec")
+        read_compile = (time.perf_counter() - start) / reruns
+
+        registry.compile(path)
+        start = time.perf_counter()
+        for _ in range(reruns):
+            registry.compile(path)
+        cached = (time.perf_counter() - start) / reruns
+
+        results.append({"benchmark": "page_rerun_compile", "page": name,
+                        "read_compile_ms": round(read_compile * 1000, 4),
+                        "registry_ms": round(cached * 1000, 4)})
+    return results
+
+
+def run(reruns=50):
+    return [cold_start()] + per_rerun(reruns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=50)
+    args = parser.parse_args()
+    for result in run(args.reruns):
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
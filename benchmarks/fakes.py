@@ -0,0 +1,217 @@
+"""Deterministic local stand-ins for the remote services the app calls.
+
+- FakeEmbeddings replaces OpenAIEmbeddings: hash-seeded unit vectors, with
+  optional per-request and per-text latency.
+- fake_chat_model replaces ChatOpenAI: a fixed answer, streamed in tokens.
+- FakeAssistantsClient replaces openai.OpenAI for the Assistants calls the
+  Data Analysis page makes, with or without streaming support.
+- FakeWikipediaServer is a local MediaWiki API for wiki_lookup (its
+  ``api_url``), and its ``run`` matches WikipediaQueryRun.run.
+"""
+import hashlib
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import List
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import FakeListChatModel
+
+WORDS = (
+    "revenue margin customer churn supply chain forecast pricing inventory logistics compliance audit "
+    "hiring retention market segment growth capital expenditure liquidity risk vendor contract quality "
+    "delivery backlog region quarter budget variance strategy product launch pipeline conversion"
+).split()
+
+
+def sample_text(seed, words=200):
+    """Deterministic business-like filler text."""
+    rng = np.random.default_rng(seed)
+    return " ".join(WORDS[i] for i in rng.integers(0, len(WORDS), words))
+
+
+class FakeEmbeddings(Embeddings):
+    """Same text, same vector; ``latency`` per request and ``per_text`` per input simulate the API."""
+
+    def __init__(self, size=1536, latency=0.0, per_text=0.0):
+        self.size = size
+        self.latency = latency
+        self.per_text = per_text
+        self.model = f"fake-embedding-{size}"
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        vector = np.random.default_rng(seed).standard_normal(self.size).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        if self.latency or self.per_text:
+            time.sleep(self.latency + self.per_text * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def fake_chat_model(answer="The document describes rising churn and supply chain delays.", token_delay=0.0):
+    """Chat model that always gives ``answer``, streamed one character at a time."""
+    return FakeListChatModel(responses=[answer], sleep=token_delay or None)
+
+
+class FakeAssistantsClient:
+    """Covers files, assistants, threads, messages and runs as used by the Data Analysis page.
+
+    Runs complete after ``polls_until_done`` retrieves. With ``streaming``
+    False, runs.stream raises like a server without SSE, so callers fall
+    back to polling. Every API call sleeps ``latency`` seconds.
+    """
+
+    def __init__(self, answer="Mean revenue is 42.0 across 1,000 rows.", polls_until_done=2,
+                 streaming=True, latency=0.0):
+        self.api_key = "fake-key"
+        self.answer = answer
+        self.polls_until_done = polls_until_done
+        self.streaming = streaming
+        self.latency = latency
+        self.calls = 0
+        self._ids = itertools.count(1)
+        self._retrieves = {}
+
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content, delete=self._ok)
+        runs = SimpleNamespace(create=self._create_run, retrieve=self._retrieve_run, stream=self._stream_run,
+                               cancel=self._ok)
+        messages = SimpleNamespace(create=self._ok, list=self._list_messages)
+        threads = SimpleNamespace(create=self._create_object, delete=self._ok, runs=runs, messages=messages)
+        assistants = SimpleNamespace(create=self._create_object, delete=self._ok, list=lambda **kwargs: [])
+        self.beta = SimpleNamespace(assistants=assistants, threads=threads)
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _new_id(self, prefix):
+        return f"{prefix}_{next(self._ids)}"
+
+    def _ok(self, *args, **kwargs):
+        self._call()
+        return SimpleNamespace(deleted=True)
+
+    def _create_file(self, file=None, purpose=None):
+        self._call()
+        return SimpleNamespace(id=self._new_id("file"))
+
+    def _file_content(self, file_id):
+        self._call()
+        return SimpleNamespace(read=lambda: b"\x89PNG fake image")
+
+    def _create_object(self, **kwargs):
+        self._call()
+        return SimpleNamespace(id=self._new_id("obj"))
+
+    def _create_run(self, thread_id, assistant_id, instructions=None, **kwargs):
+        self._call()
+        run_id = self._new_id("run")
+        self._retrieves[run_id] = 0
+        return SimpleNamespace(id=run_id, status="queued")
+
+    def _retrieve_run(self, thread_id, run_id):
+        self._call()
+        self._retrieves[run_id] += 1
+        done = self._retrieves[run_id] >= self.polls_until_done
+        return SimpleNamespace(id=run_id, status="completed" if done else "in_progress")
+
+    def _list_messages(self, thread_id, run_id=None, order="asc"):
+        self._call()
+        content = SimpleNamespace(type="text", text=SimpleNamespace(value=self.answer))
+        return [SimpleNamespace(id=f"msg_{run_id}", content=[content])]
+
+    def _stream_run(self, thread_id, assistant_id, instructions=None, **kwargs):
+        self._call()
+        if not self.streaming:
+            raise NotImplementedError("Streaming is not supported by this server")
+        return _FakeRunStream(self._new_id("run"), self.answer)
+
+
+class _FakeRunStream:
+    def __init__(self, run_id, answer):
+        self.run_id = run_id
+        self.answer = answer
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        yield SimpleNamespace(event="thread.run.created", data=SimpleNamespace(id=self.run_id))
+        for token in self.answer.split(" "):
+            content = SimpleNamespace(index=0, type="text", text=SimpleNamespace(value=token + " "), image_file=None)
+            delta = SimpleNamespace(content=[content])
+            yield SimpleNamespace(event="thread.message.delta", data=SimpleNamespace(id=f"msg_{self.run_id}", delta=delta))
+        yield SimpleNamespace(event="thread.run.completed", data=SimpleNamespace(id=self.run_id, status="completed"))
+
+
+class FakeWikipediaServer:
+    """Local MediaWiki search/extracts API on a free port; use as a context manager."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self._server = None
+
+    @property
+    def api_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/w/api.php"
+
+    def __enter__(self):
+        wiki = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                wiki.requests += 1
+                if wiki.latency:
+                    time.sleep(wiki.latency)
+                params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+                if params.get("list") == "search":
+                    limit = int(params.get("srlimit", 1))
+                    hits = [{"title": f"{params['srsearch'].title()} {i}"} for i in range(limit)]
+                    body = {"query": {"search": hits}}
+                else:
+                    extract = wiki.summary(params.get("titles", ""))
+                    body = {"query": {"pages": {"1": {"title": params.get("titles"), "extract": extract}}}}
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        return False
+
+    @staticmethod
+    def summary(title):
+        return f"{title} is a topic. " + sample_text(len(title), 80)
+
+    def run(self, query):
+        return f"Page: {query.title()} 0\nSummary: {self.summary(query.title() + ' 0')}"[:1000]
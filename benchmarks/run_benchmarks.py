@@ -0,0 +1,451 @@
+"""Offline benchmark suite: no OpenAI or Wikipedia access needed.
+
+Remote services are replaced by the stand-ins in fakes.py, and every cache
+lives in a throwaway directory, so runs on the same machine are comparable.
+Writes one JSON document with run metadata and a list of results, each
+identified by its ``case``. With ``--baseline`` the timings are compared to
+an earlier run and the exit status is 1 when any got slower than the
+tolerance allows.
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --quick --baseline bench.json
+    python benchmarks/run_benchmarks.py --suite ingest --suite retrieval
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Caches must point at a fresh directory before any app module reads the setting
+os.environ["DATACHAT_CACHE_DIR"] = tempfile.mkdtemp(prefix="datachat-bench-")
+
+import numpy as np  # noqa: E402
+from langchain_community.vectorstores import FAISS  # noqa: E402
+from langchain_text_splitters import RecursiveCharacterTextSplitter  # noqa: E402
+
+import bench_auth  # noqa: E402
+import bench_pages  # noqa: E402
+from fakes import (  # noqa: E402
+    FakeAssistantsClient, FakeEmbeddings, FakeWikipediaServer, fake_chat_model, sample_text,
+)
+
+SUITES = ["ingest", "index", "retrieval", "answer", "auth", "preview", "assistant", "wiki", "pages"]
+
+# Splitter settings of the Business page
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def _latency_fields(seconds):
+    return {
+        "p50_ms": round(statistics.median(seconds) * 1000, 4),
+        "p95_ms": round(_percentile(seconds, 0.95) * 1000, 4),
+    }
+
+
+def make_pdf(pages, words_per_page=350):
+    """PDF bytes with ``pages`` pages of text, a repeated header and a page-numbered footer."""
+    import fitz
+
+    document = fitz.open()
+    for i in range(pages):
+        page = document.new_page()
+        page.insert_text((50, 40), "ACME Corp - Quarterly Business Review - Confidential", fontsize=8)
+        page.insert_textbox(fitz.Rect(50, 60, 550, 780), sample_text(i, words_per_page), fontsize=9)
+        page.insert_text((50, 810), f"Page {i + 1} of {pages}", fontsize=8)
+    data = document.tobytes()
+    document.close()
+    return data
+
+
+def bench_ingest(page_counts):
+    from chunk_dedup import ChunkDeduplicator
+    from ingest_pipeline import build_vectorstore_streaming
+    from pdf_ingest import extract_pages, iter_pages
+
+    # Start the extraction process pool outside of the timings
+    extract_pages([make_pdf(64)])
+
+    results = []
+    for pages in page_counts:
+        pdf = make_pdf(pages)
+        start = time.perf_counter()
+        documents = extract_pages([pdf])
+        extract_seconds = time.perf_counter() - start
+
+        # Pages read from an upload buffer view, as the PDF pages pass them
+        start = time.perf_counter()
+        view_documents = extract_pages([memoryview(pdf)])
+        view_extract_seconds = time.perf_counter() - start
+        assert len(view_documents) == len(documents)
+
+        splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        embeddings = FakeEmbeddings()
+        start = time.perf_counter()
+        dedup = ChunkDeduplicator()
+        vectorstore = build_vectorstore_streaming(iter_pages([pdf]), splitter, embeddings, dedup=dedup)
+        pipeline_seconds = time.perf_counter() - start
+
+        results.append({
+            "benchmark": "pdf_ingest", "case": f"pdf_ingest/pages={pages}", "pages": len(documents),
+            "extract_seconds": round(extract_seconds, 4),
+            "extract_pages_per_second": round(len(documents) / extract_seconds, 2),
+            "view_extract_seconds": round(view_extract_seconds, 4),
+            "pipeline_seconds": round(pipeline_seconds, 4),
+            "pipeline_pages_per_second": round(len(documents) / pipeline_seconds, 2),
+            "chunks": vectorstore.index.ntotal,
+            "boilerplate_lines": dedup.stats.boilerplate_lines,
+        })
+    return results
+
+
+def bench_index(page_counts):
+    from chunk_dedup import ChunkDeduplicator
+    from index_registry import get_index_registry
+    from langchain_core.documents import Document
+    from storage import content_hash
+    from vector_index import choose_backend, optimize_vectorstore
+
+    results = []
+    registry = get_index_registry()
+    for pages in page_counts:
+        documents = [Document(page_content=sample_text(i, 350), metadata={"page_number": i + 1}) for i in range(pages)]
+        splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+        start = time.perf_counter()
+        chunks = splitter.split_documents(documents)
+        split_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        dedup = ChunkDeduplicator()
+        unique = list(dedup.filter_chunks(chunks))
+        dedup_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectorstore = FAISS.from_documents(unique, FakeEmbeddings())
+        build_seconds = time.perf_counter() - start
+
+        # The Teacher page looks indexes up by upload digests it already holds
+        content = "".join(document.page_content for document in documents).encode("utf-8")
+        settings = {"pages": pages, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+        key = registry.key_from_digests([content_hash(content)], **settings)
+        assert key == registry.key([content], **settings)
+        registry.save(key, vectorstore)
+        start = time.perf_counter()
+        loaded = registry.load(key, FakeEmbeddings())
+        load_seconds = time.perf_counter() - start
+        assert loaded is not None and loaded.index.ntotal == vectorstore.index.ntotal
+
+        backend = choose_backend(vectorstore.index.ntotal, "ivf_sq8")
+        start = time.perf_counter()
+        report = optimize_vectorstore(vectorstore, backend="ivf_sq8")
+        optimize_seconds = time.perf_counter() - start
+
+        results.append({
+            "benchmark": "split_and_index", "case": f"split_and_index/pages={pages}", "chunks": len(chunks),
+            "split_seconds": round(split_seconds, 4),
+            "dedup_seconds": round(dedup_seconds, 4),
+            "duplicates_dropped": dedup.stats.saved,
+            "index_build_seconds": round(build_seconds, 4),
+            "registry_load_seconds": round(load_seconds, 4),
+            "optimize_backend": backend,
+            "optimize_seconds": round(optimize_seconds, 4),
+            "optimized_recall_at_4": report["recall_at_4"] if report else None,
+        })
+    return results
+
+
+def bench_retrieval(corpus_sizes, dim, queries=200):
+    from vector_index import choose_backend, optimize_vectorstore
+
+    results = []
+    rng = np.random.default_rng(0)
+    embeddings = FakeEmbeddings(size=dim)
+    for size in corpus_sizes:
+        vectors = rng.standard_normal((size, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        query_vectors = vectors[rng.choice(size, queries)] + rng.normal(0, 0.01, (queries, dim)).astype(np.float32)
+
+        for backend in ("flat", choose_backend(size, "auto") if size >= 20000 else "ivf_sq8"):
+            vectorstore = FAISS.from_embeddings(
+                [(f"chunk {i}", vector) for i, vector in enumerate(vectors.tolist())], embeddings
+            )
+            optimize_vectorstore(vectorstore, backend=backend, evaluate=False)
+            seconds = []
+            for query in query_vectors.tolist():
+                start = time.perf_counter()
+                vectorstore.similarity_search_by_vector(query, k=4)
+                seconds.append(time.perf_counter() - start)
+            results.append({
+                "benchmark": "retrieval", "case": f"retrieval/vectors={size}/backend={backend}",
+                "vectors": size, "dim": dim, "backend": backend, **_latency_fields(seconds),
+            })
+    return results
+
+
+def bench_answer(corpus_size, dim, runs=20):
+    """Retrieval plus a streamed fake chat answer, the shape of one chat turn."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class FirstToken(BaseCallbackHandler):
+        def __init__(self):
+            self.at = None
+
+        def on_llm_new_token(self, token, **kwargs):
+            if self.at is None:
+                self.at = time.perf_counter()
+
+    vectorstore = FAISS.from_texts([sample_text(i, 150) for i in range(corpus_size)], FakeEmbeddings(size=dim))
+    retriever = vectorstore.as_retriever()
+    llm = fake_chat_model()
+    totals, first_tokens = [], []
+    for i in range(runs):
+        handler = FirstToken()
+        start = time.perf_counter()
+        documents = retriever.invoke(f"What problems does section {i} describe?")
+        prompt = "\n\n".join(doc.page_content for doc in documents)
+        for _ in llm.stream(prompt, config={"callbacks": [handler]}):
+            pass
+        totals.append(time.perf_counter() - start)
+        first_tokens.append(handler.at - start)
+    return [{
+        "benchmark": "answer_roundtrip", "case": f"answer_roundtrip/chunks={corpus_size}",
+        **_latency_fields(totals),
+        "first_token_p50_ms": round(statistics.median(first_tokens) * 1000, 4),
+    }]
+
+
+def bench_auth_suite(users, threads, rounds):
+    login = bench_auth.run(users, threads, rounds)
+    signup = bench_auth.run_signups(max(users // 3, 1), threads)
+    for result in (login, signup):
+        result["case"] = f"{result['benchmark']}/threads={threads}"
+    return [login, signup]
+
+
+def bench_preview(row_counts, repeats=20):
+    import io
+
+    import pandas as pd
+    from dataset_cache import get_dataset_cache
+
+    cache = get_dataset_cache()
+    results = []
+    for rows in row_counts:
+        rng = np.random.default_rng(rows)
+        frame = pd.DataFrame({
+            "region": rng.choice(["north", "south", "east", "west"], rows),
+            "revenue": rng.normal(1000, 250, rows).round(2),
+            "units": rng.integers(1, 500, rows),
+            "note": [sample_text(i, 8) for i in range(rows)],
+        })
+        data = frame.to_csv(index=False).encode("utf-8")
+
+        start = time.perf_counter()
+        info = cache.ingest("bench.csv", data)
+        ingest_seconds = time.perf_counter() - start
+
+        preview_seconds = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            cache.ingest("bench.csv", data)
+            cache.preview(info, rows=5)
+            preview_seconds.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        pd.read_csv(io.BytesIO(data)).head(5)
+        pandas_seconds = time.perf_counter() - start
+
+        results.append({
+            "benchmark": "dataset_preview", "case": f"dataset_preview/rows={rows}", "rows": rows,
+            "csv_bytes": len(data),
+            "first_load_seconds": round(ingest_seconds, 4),
+            "rerun_preview_p50_ms": round(statistics.median(preview_seconds) * 1000, 4),
+            "read_csv_head_ms": round(pandas_seconds * 1000, 4),
+        })
+    return results
+
+
+def bench_assistant(latency, runs=5):
+    from assistant_resources import AssistantResources
+    from assistant_runs import run_assistant
+
+    results = []
+    for streaming in (True, False):
+        client = FakeAssistantsClient(streaming=streaming, latency=latency)
+        resources = AssistantResources()
+        seconds = []
+        thread_id = None
+        for i in range(runs):
+            start = time.perf_counter()
+            file_id = resources.file_id(client, "bench.csv", b"region,revenue\nnorth,1\n")
+            assistant_id = resources.assistant_id(client, "gpt-4-1106-preview", "Analyst")
+            thread_id = resources.thread_id(client, file_id, thread_id)
+            client.beta.threads.messages.create(thread_id=thread_id, role="user", content=f"Question {i}")
+            output = run_assistant(client, thread_id, assistant_id, f"Question {i}")
+            seconds.append(time.perf_counter() - start)
+            assert output and output[0]["type"] == "text", output
+        mode = "stream" if streaming else "poll"
+        results.append({
+            "benchmark": "assistant_run", "case": f"assistant_run/mode={mode}", "mode": mode,
+            "api_latency_ms": latency * 1000, **_latency_fields(seconds),
+            "api_calls_per_run": round(client.calls / runs, 2),
+        })
+    return results
+
+
+def bench_wiki(latency, queries=30):
+    from wiki_lookup import WikiLookup
+
+    with FakeWikipediaServer(latency=latency) as server:
+        lookup = WikiLookup(top_k=3, chars_max=1000, disk_cache=False, api_url=server.api_url)
+        cold, warm = [], []
+        for i in range(queries):
+            start = time.perf_counter()
+            lookup.lookup(f"supply chain topic {i}")
+            cold.append(time.perf_counter() - start)
+        for i in range(queries):
+            start = time.perf_counter()
+            lookup.lookup(f"Supply  chain topic {i}?")
+            warm.append(time.perf_counter() - start)
+        requests = server.requests
+    return [
+        {"benchmark": "wiki_lookup", "case": "wiki_lookup/cold", "api_latency_ms": latency * 1000,
+         "http_requests": requests, **_latency_fields(cold)},
+        {"benchmark": "wiki_lookup", "case": "wiki_lookup/cached", **_latency_fields(warm)},
+    ]
+
+
+def bench_pages_suite(reruns):
+    results = bench_pages.run(reruns)
+    for result in results:
+        result["case"] = "/".join(filter(None, [result["benchmark"], result.get("page")]))
+    return results
+
+
+def run(suites, quick=False):
+    sizes = {
+        "pages": [10, 50] if quick else [10, 100, 500],
+        "corpus": [1000, 5000] if quick else [1000, 10000, 50000],
+        "dim": 256 if quick else 1536,
+        "users": 30 if quick else 200,
+        "rows": [10000] if quick else [10000, 200000],
+        "latency": 0.005 if quick else 0.05,
+    }
+    runners = {
+        "ingest": lambda: bench_ingest(sizes["pages"]),
+        "index": lambda: bench_index(sizes["pages"]),
+        "retrieval": lambda: bench_retrieval(sizes["corpus"], sizes["dim"]),
+        "answer": lambda: bench_answer(sizes["corpus"][0], sizes["dim"]),
+        "auth": lambda: bench_auth_suite(sizes["users"], 16, 8 if quick else 12),
+        "preview": lambda: bench_preview(sizes["rows"]),
+        "assistant": lambda: bench_assistant(sizes["latency"]),
+        "wiki": lambda: bench_wiki(sizes["latency"]),
+        "pages": lambda: bench_pages_suite(10 if quick else 50),
+    }
+    results = []
+    for suite in suites:
+        start = time.perf_counter()
+        suite_results = runners[suite]()
+        for result in suite_results:
+            result["suite"] = suite
+        results.extend(suite_results)
+        print(f"{suite}: {len(suite_results)} results in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return results
+
+
+def _metadata(quick):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "quick": quick,
+    }
+
+
+def _timing_fields(result):
+    # Lower is better for durations, higher for throughput
+    for key, value in result.items():
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            continue
+        if key.endswith("_ms") or key.endswith("seconds"):
+            yield key, value, False
+        elif key.endswith("per_second"):
+            yield key, value, True
+
+
+def compare(results, baseline, tolerance):
+    """Rows for every timing that moved by more than ``tolerance``; regressions are flagged."""
+    previous = {result["case"]: result for result in baseline["results"]}
+    rows = []
+    for result in results:
+        old = previous.get(result["case"])
+        if old is None:
+            continue
+        for key, value, higher_is_better in _timing_fields(result):
+            old_value = old.get(key)
+            if not old_value or not value:
+                continue
+            ratio = value / old_value
+            slower = ratio < 1 - tolerance if higher_is_better else ratio > 1 + tolerance
+            faster = ratio > 1 + tolerance if higher_is_better else ratio < 1 - tolerance
+            if slower or faster:
+                rows.append({"case": result["case"], "metric": key, "baseline": old_value, "current": value,
+                             "ratio": round(ratio, 3), "regression": slower})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--suite", action="append", choices=SUITES, help="Run only these suites (repeatable)")
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes, for a fast smoke run")
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="Earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown (default 0.25)")
+    args = parser.parse_args()
+
+    # Libraries and pool workers may print to stdout; keep it for the JSON report
+    stdout_fd = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        report = {"meta": _metadata(args.quick), "results": run(args.suite or SUITES, args.quick)}
+    finally:
+        sys.stdout.flush()
+        os.dup2(stdout_fd, 1)
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["comparison"] = compare(report["results"], json.load(f), args.tolerance)
+        exit_code = 1 if any(row["regression"] for row in report["comparison"]) else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
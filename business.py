@@ -1,98 +1,201 @@
 import streamlit as st
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai.embeddings import OpenAIEmbeddings
 from langchain.vectorstores import FAISS
-from langchain_openai import ChatOpenAI
 from langchain.chains import RetrievalQA
 import os
+import time
 from io import BytesIO
-import fitz  # PyMuPDF
-
-class Document:
-    """A wrapper class with page_content and metadata attributes."""
-    def __init__(self, page_content, metadata=None):
-        self.page_content = page_content
-        self.metadata = metadata or {}
-
-def process_pdfs(pdf_file):
-    try:
-        # Set OpenAI API key from secrets
-        openai_api_key = st.secrets["openai_api_key"]
-        os.environ["OPENAI_API_KEY"] = openai_api_key
-
-        # Load PDF using PyMuPDF
-        pdf_document = fitz.open(stream=pdf_file, filetype="pdf")
-        documents = []
-
-        for page_num in range(len(pdf_document)):
-            page = pdf_document[page_num]
-            text = page.get_text()
-            if text.strip():  # Add non-empty pages
-                documents.append(Document(page_content=text, metadata={"page_number": page_num + 1}))
-
-        if not documents:
-            raise ValueError("No content extracted from PDF")
-
-        st.success(f"Loaded {len(documents)} pages from PDF")
-
-        # Split text
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=100
-        )
+from answer_cache import answer_key, get_answer_cache
+import chunk_dedup
+from chunk_dedup import ChunkDeduplicator
+from embedding_cache import CachedEmbeddings
+from index_registry import get_index_registry
+from ingest_pipeline import build_vectorstore_streaming
+from openai_clients import get_chat_model, get_embeddings
+from job_queue import POLL_INTERVAL, get_job_queue
+import metrics
+from pdf_ingest import extract_pages, iter_pages, page_count
+from storage import content_hash
+from streaming import ANSWER_TAG, StreamlitTokenHandler
+from vector_index import format_report, optimize_vectorstore
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+QA_MODEL = "gpt-4o"
+QA_CHAIN_TYPE = "stuff"
+
+QUERY = (
+    "Analyze the content of this document and identify any business problems or challenges described. "
+    "If no problems are mentioned, summarize the primary topics or data discussed in the PDF."
+)
+
+def build_vectorstore(job, pdf_file, embeddings, dedup=None):
+    # Load PDF using PyMuPDF, spread across the extraction process pool
+    documents = extract_pages([pdf_file])
+
+    if not documents:
+        raise ValueError("No content extracted from PDF")
+
+    job.update(0.3, f"Loaded {len(documents)} pages from PDF")
+
+    # Split text
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+    with metrics.span("split"):
+        if dedup is not None:
+            documents = list(dedup.filter_pages(documents))
         texts = text_splitter.split_documents(documents)
+        if dedup is not None:
+            texts = list(dedup.filter_chunks(texts))
+    metrics.count("chunks_split", len(texts))
 
-        if not texts:
-            raise ValueError("No text chunks created")
-
-        st.success(f"Created {len(texts)} text chunks")
+    if not texts:
+        raise ValueError("No text chunks created")
 
-        # Create embeddings
-        embeddings = OpenAIEmbeddings()
-        vectorstore = FAISS.from_documents(texts, embeddings)
+    job.update(0.5, f"Created {len(texts)} text chunks")
 
-        # Save vectorstore
-        vectorstore.save_local("faiss_index")
+    with metrics.span("index_build"):
+        return FAISS.from_documents(texts, embeddings)
 
-        # Initialize QA chain
-        llm = ChatOpenAI(model="gpt-4o")
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=vectorstore.as_retriever()
-        )
+def build_vectorstore_streamed(job, pdf_file, embeddings, dedup=None):
+    # Pages flow into the splitter and embedding batches run while extraction continues
+    total_pages = page_count(pdf_file)
+    job.update(0.0, "Extracting and embedding...")
 
-        query = (
-            "Analyze the content of this document and identify any business problems or challenges described. "
-            "If no problems are mentioned, summarize the primary topics or data discussed in the PDF."
+    def on_progress(progress):
+        job.update(
+            0.9 * min(progress.pages / max(total_pages, 1), 1.0),
+            f"Read {progress.pages}/{total_pages} pages, embedded {progress.embedded}/{progress.chunks} chunks",
         )
-        response = qa_chain.invoke(query)
-
-        # Extract and process the result
-        result = response.get("result", "No result found")
-        if "no problems" in result.lower() or not result.strip():
-            return "No specific business problems were identified. Here is an overview of the document's content:\n" + result
-        return result
 
-    except Exception as e:
-        if "Incorrect API key provided" in str(e).lower():
-            st.error("The provided OpenAI API key is invalid. Please check and try again.")
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+    vectorstore = build_vectorstore_streaming(iter_pages([pdf_file]), text_splitter, embeddings, on_progress, dedup=dedup)
+
+    if vectorstore is None:
+        raise ValueError("No content extracted from PDF")
+
+    job.update(0.9, f"Indexed {vectorstore.index.ntotal} text chunks from {total_pages} pages")
+    return vectorstore
+
+def format_result(result):
+    if "no problems" in result.lower() or not result.strip():
+        return "No specific business problems were identified. Here is an overview of the document's content:\n" + result
+    return result
+
+def answer_cache_key(pdf_file):
+    # Identical document, query, model and chain settings give the same answer
+    return answer_key(
+        content_hash(pdf_file), QUERY, QA_MODEL,
+        chain_type=QA_CHAIN_TYPE, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+        dedup=chunk_dedup.settings()
+    )
+
+def process_pdfs(job, pdf_file, streaming=True, force_refresh=False):
+    # Runs on a job queue worker: report through the job, never through st.*
+    answers = get_answer_cache()
+    cache_key = answer_cache_key(pdf_file)
+    cached_result = None if force_refresh else answers.get(cache_key)
+    metrics.cache_result("answer", cached_result is not None)
+    if cached_result is not None:
+        job.update(1.0, "Loaded the saved analysis for this PDF")
+        return format_result(cached_result)
+
+    # Create embeddings, only embedding chunks that are not cached yet, over the shared rate-limited client
+    embeddings = CachedEmbeddings(get_embeddings())
+
+    # Reuse the saved index for this PDF and splitter settings, if any
+    registry = get_index_registry()
+    index_key = registry.key(
+        [pdf_file], chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, model=embeddings.model,
+        dedup=chunk_dedup.settings()
+    )
+    notes = []
+    vectorstore = registry.load(index_key, embeddings)
+    if vectorstore is None:
+        # Headers, footers and repeated chunks are not embedded
+        dedup = ChunkDeduplicator() if chunk_dedup.CHUNK_DEDUP else None
+        if streaming:
+            vectorstore = build_vectorstore_streamed(job, pdf_file, embeddings, dedup)
         else:
-            st.error(f"Error: {str(e)}")
-        return None
+            vectorstore = build_vectorstore(job, pdf_file, embeddings, dedup)
+        if dedup is not None:
+            notes.append(dedup.stats.format())
+
+        # Large corpora move from the flat index to a compressed IVF index
+        report = optimize_vectorstore(vectorstore)
+        if report:
+            notes.append(format_report(report))
+        registry.save(index_key, vectorstore)
+    else:
+        job.update(0.9, "Loaded the saved index for this PDF")
+
+    # Initialize QA chain
+    llm = get_chat_model(model=QA_MODEL, streaming=True, stream_usage=True, tags=[ANSWER_TAG])
+    qa_chain = RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type=QA_CHAIN_TYPE,
+        retriever=vectorstore.as_retriever()
+    )
+
+    # Tokens go to the job as they arrive; the page shows them on its next poll
+    job.update(message="Generating the analysis...")
+    with metrics.span("answer", page="business"):
+        response = qa_chain.invoke(QUERY, config={"callbacks": [StreamlitTokenHandler(job)] + metrics.callbacks()})
+
+    # Extract and process the result
+    result = response.get("result", "No result found")
+    answers.set(cache_key, result)
+    job.update(message="\n\n".join(["Analysis complete"] + notes))
+    return format_result(result)
+
+def show_error(error):
+    if "Incorrect API key provided" in str(error).lower():
+        st.error("The provided OpenAI API key is invalid. Please check and try again.")
+    else:
+        st.error(f"Error: {str(error)}")
 
 # Streamlit app
 st.title("PDF Business Problems Extractor")
 
+# Set OpenAI API key from secrets
+os.environ["OPENAI_API_KEY"] = st.secrets["openai_api_key"]
+
 # File uploader
 uploaded_file = st.file_uploader("Upload a PDF file", type=["pdf"])
 
 if uploaded_file is not None:
     st.success("File uploaded successfully.")
 
+    force_refresh = st.checkbox("Force refresh", help="Ignore the saved analysis and ask the model again.")
+
     if st.button("Process PDF"):
-        st.info("Processing PDF. Please wait...")
-        result = process_pdfs(uploaded_file.read())  # Pass file content directly
-        if result:
-            st.subheader("Document Analysis:")
-            st.write(result)
+        # Uploads of the same file share one job, whichever session started it
+        # A view of the upload buffer; the PDF is never copied or written to disk
+        pdf_file = uploaded_file.getbuffer()
+        job_key = ("business", answer_cache_key(pdf_file), force_refresh)
+        # A forced refresh must not be answered by an earlier finished run
+        get_job_queue().submit(
+            job_key, process_pdfs, pdf_file, force_refresh=force_refresh, replace_finished=force_refresh
+        )
+        st.session_state.business_job = job_key
+
+# The job keeps running across reruns; poll it until it finishes
+job = get_job_queue().get(st.session_state.get("business_job"))
+if job is not None:
+    if not job.done:
+        st.progress(job.progress, text=job.message)
+        if job.output:
+            st.markdown(job.output)
+        time.sleep(POLL_INTERVAL)
+        st.rerun()
+    elif job.status == "failed":
+        show_error(job.error)
+    else:
+        st.success(job.message)
+        st.subheader("Document Analysis:")
+        st.write(job.result)
@@ -0,0 +1,153 @@
+"""Drop boilerplate and duplicate text before it is embedded.
+
+Header and footer lines (the first and last few lines of a page) that recur
+on several pages are stripped from later pages. Chunks are then compared
+after normalization: exact repeats are dropped, and near repeats are found
+with MinHash signatures over word shingles, bucketed with LSH bands and
+confirmed by their estimated Jaccard similarity.
+"""
+import hashlib
+import os
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+
+import numpy as np
+
+# Set to 0 to embed every chunk as split
+CHUNK_DEDUP = os.environ.get("DATACHAT_CHUNK_DEDUP", "1") == "1"
+
+# Lines at the top and bottom of a page checked for boilerplate, and how many
+# pages a line must appear on before it is stripped
+EDGE_LINES = 4
+BOILERPLATE_MIN_PAGES = 3
+
+SHINGLE_WORDS = 5
+NUM_PERM = 64
+LSH_BANDS = 16
+NEAR_DUPLICATE_JACCARD = 0.85
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, _MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, _MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+
+
+def settings():
+    """Key fragment for caches whose contents depend on deduplication."""
+    if not CHUNK_DEDUP:
+        return "off"
+    return f"edge{EDGE_LINES}-pages{BOILERPLATE_MIN_PAGES}-w{SHINGLE_WORDS}-j{NEAR_DUPLICATE_JACCARD}"
+
+
+def _normalize(text):
+    return " ".join(text.lower().split())
+
+
+def _line_key(line):
+    # Page numbers and dates differ from page to page
+    return re.sub(r"\d+", "#", _normalize(line))
+
+
+def minhash(text):
+    words = _normalize(text).split()
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles],
+        dtype=np.uint64,
+    )
+    permuted = np.bitwise_and((np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME, _MAX_HASH)
+    return permuted.min(axis=0)
+
+
+@dataclass
+class DedupStats:
+    chunks: int = 0
+    boilerplate_lines: int = 0
+    exact_duplicates: int = 0
+    near_duplicates: int = 0
+
+    def add(self, other):
+        self.chunks += other.chunks
+        self.boilerplate_lines += other.boilerplate_lines
+        self.exact_duplicates += other.exact_duplicates
+        self.near_duplicates += other.near_duplicates
+
+    @property
+    def saved(self):
+        """Chunk embeddings avoided."""
+        return self.exact_duplicates + self.near_duplicates
+
+    def format(self):
+        share = self.saved / self.chunks if self.chunks else 0
+        return (
+            f"Skipped {self.saved} of {self.chunks} chunk embeddings ({share:.0%}) as duplicates, "
+            f"stripped {self.boilerplate_lines} header/footer lines"
+        )
+
+
+class ChunkDeduplicator:
+    """Online boilerplate and duplicate filter for one document collection.
+
+    Both filters are generators, so they slot into the streaming pipeline
+    without holding the corpus; state covers everything seen so far.
+    """
+
+    def __init__(self):
+        self.stats = DedupStats()
+        self._line_pages = defaultdict(int)
+        self._exact = set()
+        self._signatures = []
+        self._buckets = defaultdict(list)
+
+    def filter_pages(self, pages):
+        """Strip header/footer lines already seen on ``BOILERPLATE_MIN_PAGES`` pages."""
+        for page in pages:
+            lines = page.page_content.splitlines()
+            edges = set(range(min(EDGE_LINES, len(lines)))) | set(range(max(0, len(lines) - EDGE_LINES), len(lines)))
+            kept = []
+            seen_on_page = set()
+            for i, line in enumerate(lines):
+                key = _line_key(line)
+                if i not in edges or not key:
+                    kept.append(line)
+                    continue
+                if key not in seen_on_page:
+                    seen_on_page.add(key)
+                    self._line_pages[key] += 1
+                if self._line_pages[key] > BOILERPLATE_MIN_PAGES:
+                    self.stats.boilerplate_lines += 1
+                else:
+                    kept.append(line)
+            page.page_content = "\n".join(kept)
+            yield page
+
+    def is_duplicate(self, text):
+        """Record ``text`` and report whether an equal or near-equal text was seen before."""
+        self.stats.chunks += 1
+        normalized = _normalize(text)
+        if not normalized or normalized in self._exact:
+            self.stats.exact_duplicates += 1
+            return True
+        self._exact.add(normalized)
+
+        signature = minhash(normalized)
+        rows = NUM_PERM // LSH_BANDS
+        bands = [(b, signature[b * rows:(b + 1) * rows].tobytes()) for b in range(LSH_BANDS)]
+        candidates = {i for band in bands for i in self._buckets.get(band, ())}
+        for i in candidates:
+            if np.mean(self._signatures[i] == signature) >= NEAR_DUPLICATE_JACCARD:
+                self.stats.near_duplicates += 1
+                return True
+
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for band in bands:
+            self._buckets[band].append(index)
+        return False
+
+    def filter_chunks(self, chunks):
+        for chunk in chunks:
+            if not self.is_duplicate(chunk.page_content):
+                yield chunk
@@ -0,0 +1,114 @@
+import io
+import json
+import os
+import threading
+import uuid
+from dataclasses import asdict, dataclass
+from typing import List
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+import metrics
+from storage import cache_dir, content_hash, singleton
+
+
+@dataclass
+class DatasetInfo:
+    key: str
+    path: str
+    num_rows: int
+    columns: List[str]
+
+
+class DatasetCache:
+    """Uploaded CSV/XLSX files converted once to Parquet, keyed by upload hash.
+
+    Later reruns memory-map the Parquet file and only read what they show.
+    The cache keeps at most ``max_bytes`` of Parquet files, dropping the least
+    recently used ones first.
+    """
+
+    def __init__(self, path=None, max_bytes=10 << 30):
+        self.path = path or cache_dir("datasets")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _paths(self, key):
+        base = os.path.join(self.path, key)
+        return base + ".parquet", base + ".json"
+
+    def ingest(self, name, data):
+        key = content_hash(data)
+        parquet_path, meta_path = self._paths(key)
+        metrics.cache_result("dataset", os.path.exists(meta_path))
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                info = DatasetInfo(**json.load(f))
+            os.utime(parquet_path)
+            return info
+
+        tmp_path = f"{parquet_path}.{uuid.uuid4().hex}.tmp"
+        with metrics.span("dataset_convert"):
+            if name.endswith(".xlsx"):
+                import pandas as pd
+
+                table = pa.Table.from_pandas(pd.read_excel(io.BytesIO(data)), preserve_index=False)
+                pq.write_table(table, tmp_path)
+            else:
+                _csv_to_parquet(data, tmp_path)
+        os.replace(tmp_path, parquet_path)
+
+        metadata = pq.ParquetFile(parquet_path).metadata
+        info = DatasetInfo(key, parquet_path, metadata.num_rows, metadata.schema.to_arrow_schema().names)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(info), f)
+        self._evict()
+        return info
+
+    def preview(self, info, rows=5):
+        """First ``rows`` rows as a DataFrame, without reading the rest of the file."""
+        metrics.count("dataset_previews")
+        parquet_file = pq.ParquetFile(info.path, memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=rows):
+            return batch.to_pandas()
+        return parquet_file.schema_arrow.empty_table().to_pandas()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.path):
+                if name.endswith(".parquet"):
+                    stat = os.stat(os.path.join(self.path, name))
+                    entries.append((stat.st_mtime, stat.st_size, name[:-len(".parquet")]))
+            total = sum(size for _, size, _ in entries)
+            for _, size, key in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                for path in self._paths(key):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+
+
+def _csv_to_parquet(data, parquet_path):
+    # Stream record batches so the whole CSV is never held as one table
+    try:
+        reader = pa_csv.open_csv(pa.BufferReader(data))
+        with pq.ParquetWriter(parquet_path, reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+    except pa.ArrowInvalid:
+        # Types inferred from the first block did not hold for later ones;
+        # let pandas infer them over the whole file instead
+        import pandas as pd
+
+        table = pa.Table.from_pandas(pd.read_csv(io.BytesIO(data)), preserve_index=False)
+        pq.write_table(table, parquet_path)
+
+
+def get_dataset_cache():
+    return singleton("dataset_cache", DatasetCache)
@@ -0,0 +1,182 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import metrics
+from storage import cache_dir, content_hash, singleton
+
+
+class EmbeddingCache:
+    """Persistent embedding store keyed by chunk-text hash and embedding model.
+
+    Vectors live in one memory-mapped float32 file per model, the key -> slot
+    index lives in SQLite. Each model file holds at most ``max_bytes`` worth of
+    vectors; once full, the least recently used slots are overwritten.
+    """
+
+    def __init__(self, path=None, max_bytes=1 << 30):
+        self.path = path or cache_dir("embeddings")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._arrays = {}
+        self._conn = sqlite3.connect(os.path.join(self.path, "index.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS stores (
+                model TEXT PRIMARY KEY,
+                dim INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                model TEXT NOT NULL,
+                key TEXT NOT NULL,
+                slot INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, key)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (model, last_used)")
+        self._conn.commit()
+
+    def _array(self, model, dim):
+        array = self._arrays.get(model)
+        if array is not None:
+            return array
+        capacity = max(1, self.max_bytes // (dim * 4))
+        file_path = os.path.join(self.path, content_hash(model)[:16] + ".f32")
+        mode = "r+" if os.path.exists(file_path) else "w+"
+        array = np.memmap(file_path, dtype=np.float32, mode=mode, shape=(capacity, dim))
+        self._arrays[model] = array
+        return array
+
+    def _dim(self, model):
+        row = self._conn.execute("SELECT dim FROM stores WHERE model = ?", (model,)).fetchone()
+        return row[0] if row else None
+
+    def get_many(self, model, keys):
+        """Return {key: vector} for the keys that are cached."""
+        with self._lock:
+            dim = self._dim(model)
+            if dim is None or not keys:
+                return {}
+            array = self._array(model, dim)
+            found = {}
+            # Stay below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, slot FROM entries WHERE model = ? AND key IN ({placeholders})",
+                    (model, *batch),
+                ).fetchall()
+                for key, slot in rows:
+                    found[key] = array[slot].tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE model = ? AND key = ?",
+                    [(now, model, key) for key in found],
+                )
+                self._conn.commit()
+            return found
+
+    def put_many(self, model, items):
+        """Store (key, vector) pairs, evicting least recently used entries when full."""
+        if not items:
+            return
+        with self._lock:
+            dim = self._dim(model)
+            if dim is None:
+                dim = len(items[0][1])
+                self._conn.execute("INSERT INTO stores (model, dim) VALUES (?, ?)", (model, dim))
+            array = self._array(model, dim)
+            capacity = array.shape[0]
+
+            # Skip keys another session stored meanwhile, so each key owns exactly one slot
+            items = list(dict(items).items())
+            existing = set()
+            for start in range(0, len(items), 500):
+                batch = [key for key, _ in items[start:start + 500]]
+                placeholders = ",".join("?" * len(batch))
+                existing.update(row[0] for row in self._conn.execute(
+                    f"SELECT key FROM entries WHERE model = ? AND key IN ({placeholders})",
+                    (model, *batch),
+                ))
+            items = [(key, vector) for key, vector in items if key not in existing][-capacity:]
+            if not items:
+                self._conn.commit()
+                return
+
+            used = self._conn.execute("SELECT COUNT(*) FROM entries WHERE model = ?", (model,)).fetchone()[0]
+            fresh = min(len(items), capacity - used)
+            slots = list(range(used, used + fresh))
+            if len(items) > fresh:
+                evicted = self._conn.execute(
+                    "SELECT key, slot FROM entries WHERE model = ? ORDER BY last_used LIMIT ?",
+                    (model, len(items) - fresh),
+                ).fetchall()
+                self._conn.executemany(
+                    "DELETE FROM entries WHERE model = ? AND key = ?",
+                    [(model, key) for key, _ in evicted],
+                )
+                slots.extend(slot for _, slot in evicted)
+
+            now = time.time()
+            for slot, (_, vector) in zip(slots, items):
+                array[slot] = vector
+            array.flush()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (model, key, slot, last_used) VALUES (?, ?, ?, ?)",
+                [(model, key, slot, now) for slot, (key, _) in zip(slots, items)],
+            )
+            self._conn.commit()
+
+
+def get_embedding_cache():
+    return singleton("embedding_cache", EmbeddingCache)
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends cache misses to the wrapped embedder."""
+
+    def __init__(self, embedder: Embeddings, cache: EmbeddingCache = None, model: str = None):
+        self.embedder = embedder
+        self.cache = cache or get_embedding_cache()
+        self.model = model or getattr(embedder, "model", type(embedder).__name__)
+        self.hits = 0
+        self.misses = 0
+
+    def _embed(self, texts: List[str], embed_fn) -> List[List[float]]:
+        keys = [content_hash(text) for text in texts]
+        found = self.cache.get_many(self.model, list(dict.fromkeys(keys)))
+
+        # Embed each distinct missing text once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        metrics.cache_result("embedding", True, len(texts) - len(missing))
+        metrics.cache_result("embedding", False, len(missing))
+
+        if missing:
+            with metrics.span("embed", model=self.model):
+                vectors = np.asarray(embed_fn(list(missing.values())), dtype=np.float32)
+            metrics.count("texts_embedded", len(missing), model=self.model)
+            new_items = list(zip(missing.keys(), vectors.tolist()))
+            self.cache.put_many(self.model, new_items)
+            found.update(new_items)
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, self.embedder.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], lambda missing: [self.embedder.embed_query(missing[0])])[0]
@@ -0,0 +1,87 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+
+import faiss
+from langchain_community.vectorstores import FAISS
+
+import metrics
+from storage import cache_dir, content_hash, singleton
+
+
+class IndexRegistry:
+    """Saved FAISS indexes keyed by PDF content hash and splitter/embedding settings.
+
+    Every index lives in its own directory, so concurrent sessions never write
+    to the same path. Directory mtimes track last use; once more than
+    ``max_indexes`` are stored, the least recently used ones are removed.
+    """
+
+    def __init__(self, path=None, max_indexes=50):
+        self.path = path or cache_dir("indexes")
+        self.max_indexes = max_indexes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(pdf_contents, **settings):
+        return IndexRegistry.key_from_digests([content_hash(content) for content in pdf_contents], **settings)
+
+    @staticmethod
+    def key_from_digests(digests, **settings):
+        """Same key as ``key`` for PDFs whose content hashes are already known."""
+        return content_hash(*digests, json.dumps(settings, sort_keys=True))
+
+    def _dir(self, key):
+        return os.path.join(self.path, key)
+
+    def load(self, key, embeddings, mmap=True):
+        """Return the saved index for ``key``, or None on a miss.
+
+        With ``mmap`` the index is memory-mapped read-only; pass False when
+        vectors will be added to or removed from the loaded store.
+        """
+        index_dir = self._dir(key)
+        if not os.path.isdir(index_dir):
+            metrics.cache_result("index", False)
+            return None
+        io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        try:
+            vectorstore = FAISS.load_local(
+                index_dir, embeddings, allow_dangerous_deserialization=True, io_flags=io_flags
+            )
+            os.utime(index_dir)
+        except Exception:
+            # Evicted or half-removed meanwhile; treat as a miss and rebuild
+            metrics.cache_result("index", False)
+            return None
+        metrics.cache_result("index", True)
+        return vectorstore
+
+    def save(self, key, vectorstore):
+        index_dir = self._dir(key)
+        tmp_dir = os.path.join(self.path, f".tmp-{uuid.uuid4().hex}")
+        vectorstore.save_local(tmp_dir)
+        try:
+            os.rename(tmp_dir, index_dir)
+        except OSError:
+            # Another session saved the same key first; keep theirs
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.path):
+                full_path = os.path.join(self.path, name)
+                if name.startswith(".tmp-") or not os.path.isdir(full_path):
+                    continue
+                entries.append((os.stat(full_path).st_mtime, full_path))
+            entries.sort()
+            for _, full_path in entries[:max(0, len(entries) - self.max_indexes)]:
+                shutil.rmtree(full_path, ignore_errors=True)
+
+
+def get_index_registry():
+    return singleton("index_registry", IndexRegistry)
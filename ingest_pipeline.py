@@ -0,0 +1,86 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from langchain_community.vectorstores import FAISS
+
+import metrics
+
+# Chunks per embedding request, and embedding requests allowed in flight while
+# extraction and splitting keep going. Together they bound pipeline memory.
+EMBED_BATCH_SIZE = 64
+MAX_PENDING_BATCHES = 4
+
+
+@dataclass
+class IngestProgress:
+    pages: int = 0
+    chunks: int = 0
+    embedded: int = 0
+
+
+def _iter_chunks(pages, text_splitter, progress):
+    for page in pages:
+        progress.pages += 1
+        with metrics.span("split"):
+            chunks = text_splitter.split_documents([page])
+        metrics.count("chunks_split", len(chunks))
+        for chunk in chunks:
+            progress.chunks += 1
+            yield chunk
+
+
+def _iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def build_vectorstore_streaming(pages, text_splitter, embeddings, on_progress=None,
+                                batch_size=EMBED_BATCH_SIZE, max_pending=MAX_PENDING_BATCHES, dedup=None):
+    """Build a FAISS store from a page iterator without materializing the corpus.
+
+    Pages are split as they arrive, chunks are embedded in batches on a small
+    thread pool while extraction continues, and vectors are added to the
+    store batch by batch in page order. ``on_progress`` is called with an
+    IngestProgress after each batch is added. With ``dedup`` (a
+    ChunkDeduplicator) boilerplate and duplicate chunks are dropped before
+    they reach the embedder. Returns None when no chunks were produced.
+    """
+    progress = IngestProgress()
+    vectorstore = None
+    pending = deque()
+
+    def add_oldest():
+        nonlocal vectorstore
+        batch, future = pending.popleft()
+        text_embeddings = list(zip([chunk.page_content for chunk in batch], future.result()))
+        metadatas = [chunk.metadata for chunk in batch]
+        with metrics.span("faiss_build"):
+            if vectorstore is None:
+                vectorstore = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas)
+            else:
+                vectorstore.add_embeddings(text_embeddings, metadatas=metadatas)
+        progress.embedded += len(batch)
+        if on_progress:
+            on_progress(progress)
+
+    chunks = _iter_chunks(pages if dedup is None else dedup.filter_pages(pages), text_splitter, progress)
+    if dedup is not None:
+        chunks = dedup.filter_chunks(chunks)
+
+    with ThreadPoolExecutor(max_workers=max_pending) as executor:
+        for batch in _iter_batches(chunks, batch_size):
+            texts = [chunk.page_content for chunk in batch]
+            pending.append((batch, executor.submit(embeddings.embed_documents, texts)))
+            if len(pending) >= max_pending:
+                add_oldest()
+        while pending:
+            add_oldest()
+
+    return vectorstore
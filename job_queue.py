@@ -0,0 +1,100 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import singleton
+
+# Worker threads shared by all sessions, and how long finished jobs stay
+# available for their sessions to collect the result
+MAX_WORKERS = 4
+KEEP_FINISHED = 10 * 60
+
+# Seconds between page reruns while a job is still running
+POLL_INTERVAL = 1.0
+
+
+class Job:
+    """One unit of background work, identified by a key derived from its inputs."""
+
+    def __init__(self, key):
+        self.key = key
+        self.status = "queued"
+        self.progress = 0.0
+        self.message = "Waiting for a worker..."
+        self.output = ""
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed")
+
+    def update(self, progress=None, message=None):
+        if progress is not None:
+            self.progress = progress
+        if message is not None:
+            self.message = message
+
+    def markdown(self, text):
+        # Placeholder-compatible sink, so token streaming handlers can write into a job
+        self.output = text
+
+
+class JobQueue:
+    """Process-wide background jobs with a bounded worker pool.
+
+    Submitting a key that is already queued, running or recently finished
+    returns the existing job instead of doing the work twice. Failed jobs are
+    replaced on the next submit, and so are finished ones when the caller asks
+    for ``replace_finished``.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, keep_finished=KEEP_FINISHED):
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, replace_finished=False, **kwargs):
+        """Run ``fn(job, *args, **kwargs)`` in the background, deduplicated by ``key``.
+
+        With ``replace_finished`` a finished job for ``key`` is run again; one
+        that is still queued or running is shared as usual.
+        """
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(key)
+            if job is not None and job.status != "failed" and not (replace_finished and job.done):
+                return job
+            job = self._jobs[key] = Job(key)
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, key):
+        with self._lock:
+            # Pages poll constantly, so finished results are released even when nothing new is submitted
+            self._expire()
+            return self._jobs.get(key)
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = "done"
+            job.progress = 1.0
+        except Exception as e:
+            job.error = e
+            job.status = "failed"
+        finally:
+            job.finished_at = time.monotonic()
+
+    def _expire(self):
+        now = time.monotonic()
+        for key, job in list(self._jobs.items()):
+            if job.finished_at is not None and now - job.finished_at > self.keep_finished:
+                del self._jobs[key]
+
+
+def get_job_queue():
+    return singleton("job_queue", JobQueue)
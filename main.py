@@ -1,8 +1,8 @@
 import streamlit as st
-import sqlite3
-import os
-import bcrypt
 from email_validator import validate_email, EmailNotValidError
+import metrics
+from page_registry import get_page_registry
+from user_store import ServerBusy, add_user, hash_password, validate_user
 
 # Set the page configuration
 st.set_page_config(page_title="DataChat", page_icon=":brain:", layout="wide")
@@ -16,55 +16,13 @@ div[data-testid="stSidebarNav"] {display: none;}
 """
 st.markdown(hide_streamlit_style, unsafe_allow_html=True)
 
-# Database setup
-def init_db():
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            username TEXT NOT NULL,
-            email TEXT PRIMARY KEY,
-            password TEXT NOT NULL
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-def add_user(username, email, hashed_password):
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    try:
-        c.execute("INSERT INTO users (username, email, password) VALUES (?, ?, ?)", 
-                  (username, email, hashed_password))
-        conn.commit()
-        conn.close()
-        return True
-    except sqlite3.IntegrityError:
-        conn.close()
-        return False
-
-def validate_user(email, password):
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    c.execute("SELECT username, password FROM users WHERE email = ?", (email,))
-    user = c.fetchone()
-    conn.close()
-    
-    if not user:
-        return "email_not_found", None
-    
-    if bcrypt.checkpw(password.encode('utf-8'), user[1].encode('utf-8')):
-        return "success", user[0]
-    return "invalid_password", None
-
-# Initialize the database
-init_db()
-
 # Initialize session states
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
 if "username" not in st.session_state:
     st.session_state.username = None
+if "email" not in st.session_state:
+    st.session_state.email = None
 if "current_page" not in st.session_state:
     st.session_state.current_page = "home"
 
@@ -81,16 +39,20 @@ def show_auth_page():
         
         if st.button("Login"):
             status, username = validate_user(email, password)
+            metrics.count("logins", status=status)
             
             if status == "success":
                 st.session_state.logged_in = True
                 st.session_state.username = username
+                st.session_state.email = email
                 st.success(f"Welcome back, {username}!")
                 st.rerun()
             elif status == "email_not_found":
                 st.warning("No account found with this email. Please sign up first.")
             elif status == "invalid_password":
                 st.error("Incorrect password. Please try again.")
+            elif status == "busy":
+                st.warning("The server is busy right now. Please try again in a moment.")
     
     with signup_tab:
         st.subheader("Signup")
@@ -101,13 +63,28 @@ def show_auth_page():
         if st.button("Signup"):
             try:
                 valid_email = validate_email(new_email).email
-                hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+                hashed_password = hash_password(new_password)
                 if add_user(new_username, valid_email, hashed_password):
                     st.success("Signup successful! You can now log in.")
                 else:
                     st.error("Email already exists. Please move to login.")
             except EmailNotValidError as e:
                 st.error(f"Invalid email address: {str(e)}")
+            except ServerBusy:
+                st.warning("The server is busy right now. Please try again in a moment.")
+
+# Admin panel with the process-wide timings, counters and cache hit rates
+def show_metrics_panel():
+    st.header("Metrics")
+    snapshot = metrics.get_metrics().snapshot()
+    st.subheader("Stages")
+    st.dataframe(snapshot["stages"], use_container_width=True)
+    st.subheader("Cache hit rates")
+    st.dataframe(snapshot["caches"], use_container_width=True)
+    st.subheader("Counters")
+    st.dataframe(snapshot["counters"], use_container_width=True)
+    if metrics.METRICS_PORT:
+        st.caption(f"Prometheus endpoint: http://<host>:{metrics.METRICS_PORT}/metrics")
 
 # Main app logic
 if not st.session_state.logged_in:
@@ -124,6 +101,9 @@ else:
         "Teacher Agent": "teacher",
         "Teacher Assistant Agent": "teacher_assistant"
     }
+    # Emails are unique and verified by the login; usernames are neither
+    if metrics.METRICS_ENABLED and (st.session_state.email or "").lower() in metrics.METRICS_ADMINS:
+        pages["Metrics"] = None
 
     # Navigation radio buttons
     selected_page = st.sidebar.radio("Go to:", list(pages.keys()))
@@ -133,17 +113,17 @@ else:
     if selected_page == "Home":
         st.header("Welcome to DataChat Home Page!")
         st.write("You are logged in and can now explore the tools.")
+    elif selected_page == "Metrics":
+        show_metrics_panel()
     else:
-        page_file = f"pages/{pages[selected_page]}.py"
-        if os.path.exists(page_file):
-            with open(page_file, encoding="utf-8") as f:
-                exec(f.read(), globals())
-        else:
-            st.error(f"The page file '{page_file}' was not found.")
+        # Pages are compiled once and run in their own namespace
+        if not get_page_registry().run(pages[selected_page]):
+            st.error(f"The page file 'pages/{pages[selected_page]}.py' was not found.")
 
     # Logout button
     if st.sidebar.button("Logout"):
         st.session_state.logged_in = False
         st.session_state.username = None
+        st.session_state.email = None
         st.session_state.current_page = "home"
         st.rerun()
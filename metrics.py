@@ -0,0 +1,213 @@
+"""Per-stage timings, counters and cache hit rates for capacity planning.
+
+Off unless DATACHAT_METRICS=1; the module-level helpers then return at once
+and spans are a shared null context. When on, every span and counter is
+aggregated in memory for the admin panel and the Prometheus text endpoint
+(DATACHAT_METRICS_PORT), and optionally appended as one JSON line per
+event to DATACHAT_METRICS_JSONL.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from storage import singleton
+
+METRICS_ENABLED = os.environ.get("DATACHAT_METRICS", "0") == "1"
+METRICS_JSONL = os.environ.get("DATACHAT_METRICS_JSONL")
+METRICS_PORT = int(os.environ.get("DATACHAT_METRICS_PORT", 0))
+# Comma-separated account emails that see the in-app metrics panel
+METRICS_ADMINS = {
+    email.strip().lower() for email in os.environ.get("DATACHAT_METRICS_ADMINS", "").split(",") if email.strip()
+}
+
+# Histogram bucket bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Metrics:
+    """Thread-safe in-process aggregation of stage durations and counters."""
+
+    def __init__(self, jsonl_path=METRICS_JSONL):
+        self._lock = threading.Lock()
+        # (stage, labels) -> [count, total seconds, max seconds, bucket counts]
+        self._stages = {}
+        self._counters = defaultdict(float)
+        self._jsonl = open(jsonl_path, "a", encoding="utf-8") if jsonl_path else None
+        self._server = None
+
+    def _write(self, event):
+        if self._jsonl is not None:
+            self._jsonl.write(json.dumps(event) + "\n")
+            self._jsonl.flush()
+
+    def observe(self, stage, seconds, **labels):
+        key = (stage, _label_key(labels))
+        with self._lock:
+            entry = self._stages.get(key)
+            if entry is None:
+                entry = self._stages[key] = [0, 0.0, 0.0, [0] * len(BUCKETS)]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    entry[3][i] += 1
+            self._write({"ts": time.time(), "type": "span", "stage": stage, "seconds": seconds, **labels})
+
+    @contextlib.contextmanager
+    def span(self, stage, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def count(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += value
+            self._write({"ts": time.time(), "type": "count", "name": name, "value": value, **labels})
+
+    def snapshot(self):
+        """Stage summaries, counters and cache hit rates as plain rows."""
+        with self._lock:
+            stages = [
+                {"stage": stage, **dict(labels), "count": entry[0], "total_s": round(entry[1], 4),
+                 "mean_ms": round(entry[1] * 1000 / entry[0], 2), "max_ms": round(entry[2] * 1000, 2)}
+                for (stage, labels), entry in sorted(self._stages.items())
+            ]
+            counters = [
+                {"name": name, **dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+        caches = defaultdict(lambda: {"hit": 0, "miss": 0})
+        for row in counters:
+            if row["name"] == "cache_requests":
+                caches[row["cache"]][row["result"]] += row["value"]
+        hit_rates = [
+            {"cache": cache, **values, "hit_rate": round(values["hit"] / max(values["hit"] + values["miss"], 1), 4)}
+            for cache, values in sorted(caches.items())
+        ]
+        return {"stages": stages, "counters": counters, "caches": hit_rates}
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP datachat_stage_seconds Time spent per processing stage.",
+            "# TYPE datachat_stage_seconds histogram",
+        ]
+        with self._lock:
+            for (stage, labels), (count, total, _, buckets) in sorted(self._stages.items()):
+                label_key = (("stage", stage),) + labels
+                for bound, bucket_count in zip(BUCKETS, buckets):
+                    lines.append(f"datachat_stage_seconds_bucket{_format_labels(label_key, [('le', bound)])} {bucket_count}")
+                lines.append(f"datachat_stage_seconds_bucket{_format_labels(label_key, [('le', '+Inf')])} {count}")
+                lines.append(f"datachat_stage_seconds_sum{_format_labels(label_key)} {total}")
+                lines.append(f"datachat_stage_seconds_count{_format_labels(label_key)} {count}")
+            names = sorted({name for name, _ in self._counters})
+            for name in names:
+                lines.append(f"# TYPE datachat_{name}_total counter")
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(f"datachat_{name}_total{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port):
+        """Expose ``/metrics`` in Prometheus text format on a daemon thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200 if self.path.startswith("/metrics") else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("", port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+
+
+def _create_metrics():
+    metrics = Metrics()
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+    return metrics
+
+
+def get_metrics():
+    """Process-wide metrics, or None when instrumentation is disabled."""
+    if not METRICS_ENABLED:
+        return None
+    return singleton("metrics", _create_metrics)
+
+
+def span(stage, **labels):
+    """Context manager timing one stage; a shared no-op when disabled."""
+    if not METRICS_ENABLED:
+        return _NULL_SPAN
+    return get_metrics().span(stage, **labels)
+
+
+def observe(stage, seconds, **labels):
+    if METRICS_ENABLED:
+        get_metrics().observe(stage, seconds, **labels)
+
+
+def count(name, value=1, **labels):
+    if METRICS_ENABLED:
+        get_metrics().count(name, value, **labels)
+
+
+def cache_result(cache, hit, n=1):
+    """Record ``n`` lookups of ``cache``, for its hit rate."""
+    if METRICS_ENABLED and n:
+        get_metrics().count("cache_requests", n, cache=cache, result="hit" if hit else "miss")
+
+
+def timed_iter(stage, iterable, **labels):
+    """Yield from ``iterable``, timing only the time spent producing each item."""
+    if not METRICS_ENABLED:
+        return iterable
+    return _timed_iter(stage, iterable, labels)
+
+
+def _timed_iter(stage, iterable, labels):
+    metrics = get_metrics()
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        metrics.observe(stage, time.perf_counter() - start, **labels)
+        yield item
+
+
+def callbacks():
+    """LangChain callbacks to add to a chain call: the metrics handler when enabled."""
+    if not METRICS_ENABLED:
+        return []
+    # Imported here so the home page does not load LangChain just for metrics
+    from metrics_callbacks import MetricsCallbackHandler
+    return [MetricsCallbackHandler(get_metrics())]
@@ -0,0 +1,52 @@
+"""LangChain callback handler feeding chain timings and token counts into metrics.
+
+Kept out of metrics.py so importing metrics does not load LangChain.
+"""
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Times retrieval and LLM calls inside LangChain chains and counts their tokens."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._starts = {}
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self.metrics.observe("retrieval", time.perf_counter() - self._starts.pop(run_id, time.perf_counter()))
+        self.metrics.count("retrieved_chunks", len(documents))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self.metrics.observe("llm", time.perf_counter() - self._starts.pop(run_id, time.perf_counter()))
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        if not usage:
+            # Streamed responses carry usage on the message instead
+            for generations in response.generations:
+                for generation in generations:
+                    message_usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt_tokens += message_usage.get("input_tokens", 0)
+                    completion_tokens += message_usage.get("output_tokens", 0)
+        if prompt_tokens:
+            self.metrics.count("llm_tokens", prompt_tokens, kind="prompt")
+        if completion_tokens:
+            self.metrics.count("llm_tokens", completion_tokens, kind="completion")
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+        self.metrics.count("llm_errors")
@@ -0,0 +1,266 @@
+"""OpenAI clients shared by every session of the process.
+
+All clients go through one keep-alive httpx connection pool. Per API key, a
+token-bucket limiter spreads requests and tokens per minute across sessions,
+so bursts queue instead of failing. Embedding requests are split into
+batches that run concurrently, each retried with jittered exponential
+backoff on 429s, dropped connections, timeouts and 5xx responses; chat and
+Assistants calls use the SDK's own retries, which also back off with jitter
+and honour Retry-After.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import httpx
+import openai
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.rate_limiters import BaseRateLimiter
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+import metrics
+
+# Account limits shared by all sessions; set them to the organisation's tier
+OPENAI_RPM = int(os.environ.get("DATACHAT_OPENAI_RPM", 500))
+OPENAI_TPM = int(os.environ.get("DATACHAT_OPENAI_TPM", 1000000))
+
+MAX_CONNECTIONS = 64
+MAX_KEEPALIVE_CONNECTIONS = 32
+KEEPALIVE_EXPIRY = 60
+REQUEST_TIMEOUT = 120
+
+# Texts per embedding request, and embedding requests in flight per process
+EMBED_BATCH_SIZE = 256
+EMBED_CONCURRENCY = 4
+
+MAX_RETRIES = 6
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+# Besides 429s: dropped connections, timeouts and 5xx responses
+TRANSIENT_ERRORS = (openai.APIConnectionError, openai.InternalServerError)
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units a minute, up to one minute's worth."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """Block until ``amount`` units are available and take them; returns the seconds waited."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return waited
+                delay = (amount - self.level) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def charge(self, amount):
+        """Take ``amount`` units after the fact; the level may go negative, delaying later callers."""
+        with self._lock:
+            self._refill()
+            self.level -= amount
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets for one API key."""
+
+    def __init__(self, rpm=OPENAI_RPM, tpm=OPENAI_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    def acquire(self, tokens=0):
+        # Without an estimate, wait until the token budget is no longer overdrawn
+        waited = self.requests.acquire(1) + self.tokens.acquire(max(tokens, 1))
+        if waited:
+            metrics.observe("rate_limit_wait", waited)
+
+    def charge(self, tokens):
+        self.tokens.charge(tokens)
+
+
+class _ChatRateLimiter(BaseRateLimiter):
+    """Adapter so ChatOpenAI waits on the shared limiter before every request."""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+
+    def acquire(self, *, blocking=True):
+        self.limiter.acquire()
+        return True
+
+    async def aacquire(self, *, blocking=True):
+        await asyncio.to_thread(self.limiter.acquire)
+        return True
+
+
+class _UsageCharger(BaseCallbackHandler):
+    """Charges the tokens a chat call actually used to the shared limiter."""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        tokens = usage.get("total_tokens", 0)
+        if not tokens:
+            for generations in response.generations:
+                for generation in generations:
+                    message_usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    tokens += message_usage.get("total_tokens", 0)
+        if tokens:
+            self.limiter.charge(tokens)
+
+
+def estimate_tokens(texts):
+    # About four characters per token for English text
+    return sum(len(text) // 4 + 1 for text in texts)
+
+
+def _retry_delay(error, attempt):
+    retry_after = getattr(getattr(error, "response", None), "headers", {}).get("retry-after")
+    try:
+        return float(retry_after) + random.uniform(0, 1)
+    except (TypeError, ValueError):
+        # Full jitter, so sessions that were throttled together do not retry together
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def call_with_retries(fn, *args, limiter=None, tokens=0, **kwargs):
+    """Call ``fn`` under ``limiter``, retrying 429s and transient errors with jittered exponential backoff."""
+    for attempt in range(MAX_RETRIES + 1):
+        if limiter is not None:
+            limiter.acquire(tokens)
+        try:
+            return fn(*args, **kwargs)
+        except (openai.RateLimitError, *TRANSIENT_ERRORS) as e:
+            if isinstance(e, openai.RateLimitError):
+                metrics.count("openai_rate_limited")
+            else:
+                metrics.count("openai_transient_errors")
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(_retry_delay(e, attempt))
+
+
+class PooledEmbeddings(Embeddings):
+    """OpenAI embeddings sent as concurrent, rate-limited batches over the shared pool."""
+
+    def __init__(self, embedder, limiter, executor, batch_size=EMBED_BATCH_SIZE):
+        self.embedder = embedder
+        self.limiter = limiter
+        self.executor = executor
+        self.batch_size = batch_size
+        self.model = embedder.model
+
+    def _embed_batch(self, texts):
+        return call_with_retries(
+            self.embedder.embed_documents, texts, limiter=self.limiter, tokens=estimate_tokens(texts)
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1:
+            return self._embed_batch(texts) if texts else []
+        vectors = []
+        for batch_vectors in self.executor.map(self._embed_batch, batches):
+            vectors.extend(batch_vectors)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return call_with_retries(self.embedder.embed_query, text, limiter=self.limiter, tokens=estimate_tokens([text]))
+
+
+_lock = threading.Lock()
+_http_client = None
+_embed_executor = None
+_limiters = {}
+_clients = {}
+_embeddings = {}
+_chat_models = {}
+
+
+def _api_key(api_key):
+    return api_key or os.environ.get("OPENAI_API_KEY")
+
+
+def get_http_client():
+    """Keep-alive connection pool used by every OpenAI client of the process."""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+                timeout=REQUEST_TIMEOUT,
+            )
+        return _http_client
+
+
+def get_rate_limiter(api_key=None):
+    with _lock:
+        key = _api_key(api_key)
+        if key not in _limiters:
+            _limiters[key] = RateLimiter()
+        return _limiters[key]
+
+
+def get_openai_client(api_key=None):
+    """Shared openai.OpenAI for ``api_key`` (default: OPENAI_API_KEY)."""
+    http_client = get_http_client()
+    with _lock:
+        key = _api_key(api_key)
+        if key not in _clients:
+            _clients[key] = openai.OpenAI(api_key=key, http_client=http_client, max_retries=MAX_RETRIES)
+        return _clients[key]
+
+
+def get_embeddings(api_key=None, **kwargs):
+    """Shared PooledEmbeddings for ``api_key`` and OpenAIEmbeddings settings ``kwargs``."""
+    global _embed_executor
+    http_client = get_http_client()
+    limiter = get_rate_limiter(api_key)
+    with _lock:
+        key = (_api_key(api_key), tuple(sorted(kwargs.items())))
+        if key not in _embeddings:
+            if _embed_executor is None:
+                _embed_executor = ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY, thread_name_prefix="embed")
+            embedder = OpenAIEmbeddings(api_key=key[0], http_client=http_client, max_retries=0, **kwargs)
+            _embeddings[key] = PooledEmbeddings(embedder, limiter, _embed_executor)
+        return _embeddings[key]
+
+
+def get_chat_model(api_key=None, **kwargs):
+    """Shared ChatOpenAI for ``api_key`` and settings ``kwargs``, throttled by the shared limiter."""
+    http_client = get_http_client()
+    limiter = get_rate_limiter(api_key)
+    with _lock:
+        key = (_api_key(api_key), repr(sorted(kwargs.items())))
+        if key not in _chat_models:
+            _chat_models[key] = ChatOpenAI(
+                api_key=key[0], http_client=http_client, max_retries=MAX_RETRIES,
+                rate_limiter=_ChatRateLimiter(limiter), callbacks=[_UsageCharger(limiter)], **kwargs
+            )
+        return _chat_models[key]
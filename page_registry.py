@@ -0,0 +1,56 @@
+import os
+import threading
+
+from storage import singleton
+
+# Pages are looked up under pages/ first, then next to main.py, wherever
+# Streamlit was started from
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGE_DIRS = (os.path.join(APP_DIR, "pages"), APP_DIR)
+
+
+class PageRegistry:
+    """Compiled page scripts, recompiled only when the file's mtime changes.
+
+    Each run gets a fresh namespace, so a page's imports and globals never
+    leak into main.py or into other pages. Heavy libraries are therefore only
+    imported the first time a page that needs them is opened.
+    """
+
+    def __init__(self, page_dirs=PAGE_DIRS):
+        self.page_dirs = page_dirs
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, name):
+        for page_dir in self.page_dirs:
+            path = os.path.join(page_dir, f"{name}.py")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def compile(self, path):
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._compiled.get(path)
+            if cached and cached[0] == version:
+                return cached[1]
+        with open(path, encoding="utf-8") as f:
+            code = compile(f.read(), path, "exec")
+        with self._lock:
+            self._compiled[path] = (version, code)
+        return code
+
+    def run(self, name):
+        """Run page ``name``; returns False if no page file exists."""
+        path = self.resolve(name)
+        if path is None:
+            return False
+        namespace = {"__name__": "__main__", "__file__": os.path.abspath(path)}
+        exec(self.compile(path), namespace)
+        return True
+
+
+def get_page_registry():
+    return singleton("page_registry", PageRegistry)
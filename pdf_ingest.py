@@ -0,0 +1,158 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import NamedTuple
+
+import fitz  # PyMuPDF
+from langchain_core.documents import Document
+
+import metrics
+
+# Pages handed to one worker task, and the page count below which a PDF is
+# extracted in-process because pool start-up would cost more than it saves
+PAGES_PER_TASK = 16
+INLINE_PAGE_LIMIT = 32
+
+# In-memory PDFs at least this large reach pool workers through one shared
+# memory block instead of being pickled into every page-range task
+SHARED_MEMORY_MIN_BYTES = 4 << 20
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Process-wide extraction pool, created on first use.
+
+    Uses the spawn start method: forking the multi-threaded Streamlit server
+    is not safe.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+class SharedPdf(NamedTuple):
+    """Picklable handle to a PDF copied into a shared memory block."""
+    name: str
+    size: int
+
+
+def _share(data):
+    block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    block.buf[:len(data)] = data
+    return block
+
+
+@contextmanager
+def _attach(shared):
+    block = shared_memory.SharedMemory(name=shared.name)
+    view = block.buf[:shared.size]
+    try:
+        yield view
+    finally:
+        view.release()
+        block.close()
+
+
+def open_pdf(source):
+    """Open a path, or a bytes-like buffer (bytes, memoryview) without copying it to disk."""
+    if isinstance(source, str):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def page_count(source):
+    with open_pdf(source) as pdf_document:
+        return len(pdf_document)
+
+
+def _extract_range(source, start, end):
+    if isinstance(source, SharedPdf):
+        with _attach(source) as view:
+            return _extract_range(view, start, end)
+    with open_pdf(source) as pdf_document:
+        return [(page_num + 1, pdf_document[page_num].get_text()) for page_num in range(start, end)]
+
+
+def iter_pages(sources, names=None, max_workers=None):
+    """Yield one Document per non-empty page of every PDF in ``sources``.
+
+    Sources are file paths or bytes-like buffers, e.g. the memoryview of
+    UploadedFile.getbuffer(). Pages come out in document order and
+    then page order, with ``source`` and 1-based ``page_number`` metadata.
+    Large PDFs are split into page ranges that run across the process pool;
+    at most ``max_workers`` ranges are in flight, which bounds memory use.
+    """
+    names = names or [source if isinstance(source, str) else f"document_{i + 1}" for i, source in enumerate(sources)]
+
+    tasks = []
+    for source, name in zip(sources, names):
+        pages = page_count(source)
+        for start in range(0, pages, PAGES_PER_TASK):
+            tasks.append((source, name, start, min(start + PAGES_PER_TASK, pages)))
+
+    if sum(end - start for _, _, start, end in tasks) <= INLINE_PAGE_LIMIT:
+        results = ((name, _extract_range(source, start, end)) for source, name, start, end in tasks)
+    else:
+        results = _run_pooled(tasks, max_workers or os.cpu_count() or 1)
+
+    for name, pages in metrics.timed_iter("extract", results):
+        metrics.count("pages_extracted", len(pages))
+        for page_number, text in pages:
+            if text.strip():  # Skip empty pages
+                yield Document(page_content=text, metadata={"source": name, "page_number": page_number})
+
+
+def _run_pooled(tasks, window):
+    executor = get_executor()
+    pending = deque()
+    # One shared block per large in-memory PDF, removed once its pages are read
+    blocks = {}
+    # Memoryviews cannot be pickled; smaller ones are copied once per PDF
+    copies = {}
+
+    def submit(source, start, end):
+        if not isinstance(source, str) and len(source) >= SHARED_MEMORY_MIN_BYTES:
+            if id(source) not in blocks:
+                blocks[id(source)] = _share(source)
+            source = SharedPdf(blocks[id(source)].name, len(source))
+        elif isinstance(source, memoryview):
+            if id(source) not in copies:
+                copies[id(source)] = bytes(source)
+            source = copies[id(source)]
+        return executor.submit(_extract_range, source, start, end)
+
+    try:
+        tasks = iter(tasks)
+        for source, name, start, end in tasks:
+            pending.append((name, submit(source, start, end)))
+            if len(pending) >= window:
+                break
+        while pending:
+            name, future = pending.popleft()
+            pages = future.result()
+            for source, next_name, start, end in tasks:
+                pending.append((next_name, submit(source, start, end)))
+                break
+            yield name, pages
+    finally:
+        for future in (future for _, future in pending):
+            future.cancel()
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+
+def extract_pages(sources, names=None, max_workers=None):
+    """List form of iter_pages."""
+    return list(iter_pages(sources, names=names, max_workers=max_workers))
@@ -0,0 +1,81 @@
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import streamlit as st
+
+from storage import singleton
+
+
+def session_key(name="session_key"):
+    """Stable id for the current browser session, kept in st.session_state."""
+    if name not in st.session_state:
+        st.session_state[name] = uuid.uuid4().hex
+    return st.session_state[name]
+
+
+class SessionCache:
+    """Per-session objects that survive Streamlit reruns.
+
+    Entries idle for longer than ``idle_timeout`` seconds are dropped, and
+    least recently used entries are dropped while the estimated total size is
+    above ``max_bytes``. ``sizeof`` estimates the size of one entry; it is
+    measured when the entry is created and again on ``resize``, so callers
+    that grow an entry in place report it there.
+    """
+
+    def __init__(self, idle_timeout=1800, max_bytes=2 << 30, sizeof=sys.getsizeof):
+        self.idle_timeout = idle_timeout
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                value = factory()
+                entry = (value, self.sizeof(value))
+            else:
+                entry = entry[1:]
+            self._entries[key] = (time.monotonic(),) + entry
+            self._evict(keep=key)
+            return entry[0]
+
+    def resize(self, key):
+        """Measure ``key``'s entry again after it changed size."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], entry[1], self.sizeof(entry[1]))
+                self._evict(keep=key)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self, keep):
+        now = time.monotonic()
+        for key, (last_used, _, _) in list(self._entries.items()):
+            if key != keep and now - last_used > self.idle_timeout:
+                del self._entries[key]
+
+        total = sum(size for _, _, size in self._entries.values())
+        # Oldest entries first; the session being served is never evicted
+        for key, (_, _, size) in list(self._entries.items()):
+            if total <= self.max_bytes:
+                break
+            if key != keep:
+                total -= size
+                del self._entries[key]
+
+
+def get_session_cache(name, **kwargs):
+    """SessionCache registered under ``name``; ``kwargs`` apply when it is first created."""
+    return singleton(("session_cache", name), lambda: SessionCache(**kwargs))
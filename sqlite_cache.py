@@ -0,0 +1,63 @@
+import sqlite3
+import threading
+import time
+
+
+class SqliteCache:
+    """Small persistent key/value cache shared by every session of the process.
+
+    Entries expire ``ttl`` seconds after being stored (never when ttl is
+    None), and once more than ``max_entries`` are stored the least recently
+    used ones are removed.
+    """
+
+    def __init__(self, path, max_entries=10000, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (last_used)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, stored_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE cache SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, stored_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            if self.ttl is not None:
+                self._conn.execute("DELETE FROM cache WHERE stored_at < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
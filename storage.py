@@ -0,0 +1,42 @@
+import hashlib
+import os
+import threading
+
+# Root directory for on-disk caches shared by every session of this process
+CACHE_ROOT = os.environ.get("DATACHAT_CACHE_DIR", ".cache")
+
+
+def cache_dir(name):
+    path = os.path.join(CACHE_ROOT, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def content_hash(*parts):
+    """Stable sha256 hex digest over str and bytes-like (bytes, memoryview) parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(memoryview(part).nbytes.to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+_singletons = {}
+_singletons_lock = threading.RLock()
+
+
+def singleton(key, factory):
+    """The process-wide object registered under ``key``, created by ``factory()`` on first use.
+
+    Streamlit reruns page scripts in every session, so objects shared between
+    sessions (caches, registries, worker pools) are kept here instead.
+    """
+    value = _singletons.get(key)
+    if value is None:
+        with _singletons_lock:
+            value = _singletons.get(key)
+            if value is None:
+                value = _singletons[key] = factory()
+    return value
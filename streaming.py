@@ -0,0 +1,25 @@
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Tag put on the LLM whose tokens should reach the page. Chains may call other
+# LLMs (e.g. to condense the question) whose output must not be shown.
+ANSWER_TAG = "answer"
+
+
+class StreamlitTokenHandler(BaseCallbackHandler):
+    """Writes the tokens of the tagged LLM into a Streamlit placeholder as they arrive."""
+
+    def __init__(self, container, tag=ANSWER_TAG, cursor="▌"):
+        self.container = container
+        self.tag = tag
+        self.cursor = cursor
+        self.text = ""
+
+    def on_llm_new_token(self, token, *, tags=None, **kwargs):
+        if self.tag not in (tags or []) or not isinstance(token, str):
+            return
+        self.text += token
+        self.container.markdown(self.text + self.cursor)
+
+    def on_llm_end(self, response, *, tags=None, **kwargs):
+        if self.tag in (tags or []) and self.text:
+            self.container.markdown(self.text)
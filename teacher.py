@@ -1,57 +1,217 @@
 import streamlit as st
 import os
-from typing import List
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+import time
+from typing import Dict, List, Optional, Tuple, Union
 from langchain.vectorstores import FAISS
-from langchain.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+from langchain.memory import ConversationBufferMemory, ConversationSummaryBufferMemory
+from langchain_community.callbacks import get_openai_callback
+import chunk_dedup
+from chunk_dedup import ChunkDeduplicator, DedupStats
+from embedding_cache import CachedEmbeddings
+from index_registry import get_index_registry
+from job_queue import POLL_INTERVAL, get_job_queue
+import metrics
+from openai_clients import get_chat_model, get_embeddings
+from pdf_ingest import extract_pages
+from session_cache import get_session_cache, session_key
+from storage import content_hash
+from streaming import ANSWER_TAG, StreamlitTokenHandler
+from vector_index import copy_vectorstore, format_report, merge_into, optimize_vectorstore, remove_documents
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Idle agents are dropped after 30 minutes, and all agents together stay under ~2 GB
+AGENT_IDLE_TIMEOUT = 30 * 60
+AGENT_MAX_BYTES = 2 << 30
+
+# Token budget for the conversation memory: recent turns are kept verbatim up to
+# this many tokens and older turns are folded into a rolling summary. 0 keeps
+# the full, unbounded history.
+MEMORY_TOKEN_BUDGET = int(os.environ.get("DATACHAT_MEMORY_TOKEN_BUDGET", 2000))
+
+def build_pdf_store(job, pdf_file: Union[bytes, memoryview], embeddings, index_key: str) -> Tuple[Optional[FAISS], Optional[DedupStats]]:
+    """Job queue task: the vector store of one PDF (None when it has no text)
+    and its deduplication stats (None when the store was already saved).
+
+    Runs on a worker thread and may be shared by several sessions, so callers
+    copy the store before changing it.
+    """
+    registry = get_index_registry()
+    file_store = registry.load(index_key, embeddings, mmap=False)
+    if file_store is not None:
+        return file_store, None
+
+    job.update(0.1, "Extracting pages...")
+    pages = extract_pages([pdf_file])
+
+    # Split documents into chunks, leaving out headers, footers and repeated chunks
+    dedup = ChunkDeduplicator() if chunk_dedup.CHUNK_DEDUP else None
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    with metrics.span("split"):
+        if dedup is not None:
+            pages = list(dedup.filter_pages(pages))
+        splits = text_splitter.split_documents(pages)
+        if dedup is not None:
+            splits = list(dedup.filter_chunks(splits))
+    metrics.count("chunks_split", len(splits))
+    stats = dedup.stats if dedup is not None else None
+    if not splits:
+        return None, stats
+
+    # Create FAISS vector store
+    job.update(0.4, f"Embedding {len(splits)} chunks from {len(pages)} pages...")
+    with metrics.span("index_build"):
+        file_store = FAISS.from_documents(splits, embeddings)
+    registry.save(index_key, file_store)
+    return file_store, stats
 
 class TeacherAgent:
-    def __init__(self):
+    def __init__(self, memory_token_budget: int = MEMORY_TOKEN_BUDGET):
         try:
             api_key = st.secrets["openai_api_key"]
             if not api_key:
                 raise ValueError("OpenAI API key not found in secrets.toml file.")
             
-            # Initialize embeddings
-            self.embeddings = OpenAIEmbeddings(api_key=api_key)
+            self.api_key = api_key
+
+            # Initialize embeddings, backed by the shared on-disk cache and the shared rate-limited client
+            self.embeddings = CachedEmbeddings(get_embeddings(api_key))
             self.vector_store = None
-            self.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+            if memory_token_budget:
+                self.memory = ConversationSummaryBufferMemory(
+                    llm=get_chat_model(self.api_key, temperature=0, model_name="gpt-4"),
+                    max_token_limit=memory_token_budget,
+                    memory_key="chat_history",
+                    return_messages=True,
+                )
+            else:
+                self.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+            # Token usage of every answered question, oldest first
+            self.turn_tokens: List[Dict[str, int]] = []
             self.conversation_chain = None
+            # Content hash of each ingested PDF -> ids of its chunks in the vector store
+            self.sources = {}
+            # Content hash of each PDF still being ingested -> its job queue key
+            self.pending = {}
+            # Recall/latency report from the last index conversion, if any
+            self.index_report = None
+            # Boilerplate and duplicate chunks skipped across the PDFs this agent embedded
+            self.dedup_stats = DedupStats()
         except Exception as e:
             st.error(f"Error initializing TeacherAgent: {e}")
 
-    def load_knowledge_base(self, pdf_paths: List[str]) -> None:
+    def load_knowledge_base(self, pdf_files: Dict[str, Optional[Union[bytes, memoryview]]]) -> bool:
+        """Sync the vector store with the uploaded PDFs.
+
+        ``pdf_files`` maps the content hash of every uploaded PDF to its
+        contents (bytes or a memoryview of the upload), or to None when that
+        PDF is already ingested or queued. New PDFs are ingested by background
+        jobs and merged into the store on a later call once their job has
+        finished; PDFs missing from the mapping are removed.
+        Returns True when the knowledge base changed.
+        """
+        changed = False
         try:
-            documents = []
-            for pdf_path in pdf_paths:
-                loader = PyPDFLoader(pdf_path)
-                documents.extend(loader.load())
-
-            # Split documents into chunks
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            splits = text_splitter.split_documents(documents)
-
-            # Create FAISS vector store
-            self.vector_store = FAISS.from_documents(splits, self.embeddings)
-
-            # Create a Conversational Retrieval Chain
-            self.conversation_chain = ConversationalRetrievalChain.from_llm(
-                llm=ChatOpenAI(temperature=0.7, model_name="gpt-4"),
-                retriever=self.vector_store.as_retriever(),
-                memory=self.memory,
-                verbose=True
-            )
+            # Remove the vectors of PDFs that were dropped from the uploader
+            for digest in [digest for digest in self.sources if digest not in pdf_files]:
+                ids = self.sources.pop(digest)
+                if ids:
+                    remove_documents(self.vector_store, ids)
+                changed = True
+            for digest in [digest for digest in self.pending if digest not in pdf_files]:
+                del self.pending[digest]
+
+            # Queue only the PDFs that are new to this agent
+            queue = get_job_queue()
+            for digest, pdf_file in pdf_files.items():
+                if digest in self.sources or digest in self.pending or pdf_file is None:
+                    continue
+                index_key = self._index_key(digest)
+                queue.submit(index_key, build_pdf_store, pdf_file, self.embeddings, index_key)
+                self.pending[digest] = index_key
+
+            # Merge the PDFs whose jobs have finished, in upload order
+            for digest in [digest for digest in pdf_files if digest in self.pending]:
+                job = queue.get(self.pending[digest])
+                if job is not None and not job.done:
+                    continue
+                del self.pending[digest]
+                if job is None:
+                    # Expired before this session picked it up; queued again on the next call
+                    continue
+                if job.status == "failed":
+                    st.error(f"Error loading knowledge base: {job.error}")
+                    continue
+                file_store, stats = job.result
+                if stats is not None:
+                    self.dedup_stats.add(stats)
+                if file_store is None:
+                    # No text in this PDF; remember it so it is not re-read on every rerun
+                    self.sources[digest] = []
+                    continue
+                if self.vector_store is None:
+                    self.vector_store = copy_vectorstore(file_store)
+                else:
+                    merge_into(self.vector_store, file_store)
+                self.sources[digest] = list(file_store.index_to_docstore_id.values())
+                changed = True
+
+            if not any(self.sources.values()):
+                self.vector_store = None
+                self.conversation_chain = None
+                return changed
+
+            # Once the knowledge base grows large, switch to a compressed index that still supports removal
+            if changed:
+                report = optimize_vectorstore(self.vector_store, mutable=True)
+                if report:
+                    self.index_report = report
+            if self.conversation_chain is None:
+                # Create a Conversational Retrieval Chain. Only the answering LLM streams;
+                # the condensed question is never shown to the student.
+                self.conversation_chain = ConversationalRetrievalChain.from_llm(
+                    llm=get_chat_model(self.api_key, temperature=0.7, model_name="gpt-4", streaming=True,
+                                       stream_usage=True, tags=[ANSWER_TAG]),
+                    condense_question_llm=get_chat_model(self.api_key, temperature=0.7, model_name="gpt-4"),
+                    retriever=self.vector_store.as_retriever(),
+                    memory=self.memory,
+                    verbose=True
+                )
         except Exception as e:
             st.error(f"Error loading knowledge base: {e}")
+        return changed
 
-    def guide_student(self, question: str) -> str:
+    def _index_key(self, digest: str) -> str:
+        return get_index_registry().key_from_digests(
+            [digest], chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, model=self.embeddings.model,
+            dedup=chunk_dedup.settings()
+        )
+
+    def approx_size(self) -> int:
+        """Rough in-memory size of the vector store, used for the agent cache cap."""
+        if getattr(self, "vector_store", None) is None:
+            return 0
+        index = self.vector_store.index
+        texts = sum(len(doc.page_content) for doc in self.vector_store.docstore._dict.values())
+        return index.ntotal * index.d * 4 + texts
+
+    def guide_student(self, question: str, stream_to=None) -> str:
+        """Answer ``question``; with ``stream_to`` (a Streamlit placeholder) tokens are rendered as they arrive.
+
+        The memory is updated by the chain once the answer is complete.
+        """
         try:
             if not self.conversation_chain:
                 return "Knowledge base is not loaded. Please upload PDFs first."
-            response = self.conversation_chain({"question": question})
+            callbacks = [StreamlitTokenHandler(stream_to)] if stream_to is not None else []
+            callbacks += metrics.callbacks()
+            # Count every OpenAI call of this turn: question condensing, answer and memory summary
+            with get_openai_callback() as usage, metrics.span("answer", page="teacher"):
+                response = self.conversation_chain.invoke({"question": question}, config={"callbacks": callbacks})
+            self.turn_tokens.append({"prompt": usage.prompt_tokens, "completion": usage.completion_tokens})
             return response["answer"]
         except Exception as e:
             return f"Error guiding student: {e}"
@@ -66,26 +226,48 @@ def main():
         with st.expander("Upload Knowledge Base", expanded=True):
             uploaded_files = st.file_uploader("Upload PDFs:", type=["pdf"], accept_multiple_files=True)
 
-    teacher = TeacherAgent()
+    # Keep the agent, its vector store and its memory across reruns of this session
+    agents = get_session_cache(
+        "teacher_agents", idle_timeout=AGENT_IDLE_TIMEOUT, max_bytes=AGENT_MAX_BYTES,
+        sizeof=lambda agent: agent.approx_size()
+    )
+    teacher = agents.get(session_key(), TeacherAgent)
+
+    # Load Knowledge Base, passing the contents only of PDFs the agent has not seen yet
+    if teacher:
+        # Each upload is hashed once, not on every rerun
+        known_digests = st.session_state.get("teacher_upload_digests", {})
+        digests = {
+            file.file_id: known_digests.get(file.file_id) or content_hash(file.getbuffer())
+            for file in uploaded_files or []
+        }
+        st.session_state.teacher_upload_digests = digests
 
-    # Load Knowledge Base
-    if uploaded_files and teacher:
-        pdf_paths = []
-        for file in uploaded_files:
-            temp_path = f"temp_{file.name}"
-            with open(temp_path, "wb") as f:
-                f.write(file.read())
-            pdf_paths.append(temp_path)
+        pdf_files = {}
+        for file in uploaded_files or []:
+            digest = digests[file.file_id]
+            if digest in teacher.sources or digest in teacher.pending or digest in pdf_files:
+                pdf_files.setdefault(digest, None)
+            else:
+                # A view of the upload buffer: no copy and nothing written to disk
+                pdf_files[digest] = file.getbuffer()
 
-        teacher.load_knowledge_base(pdf_paths)
-        st.success("Knowledge base loaded successfully!")
+        if teacher.load_knowledge_base(pdf_files):
+            # Only a changed store is measured again for the cache cap
+            agents.resize(session_key())
+            if teacher.vector_store:
+                st.success("Knowledge base loaded successfully!")
+        if teacher.index_report and teacher.vector_store:
+            st.sidebar.caption(format_report(teacher.index_report))
+        if teacher.dedup_stats.chunks:
+            st.sidebar.caption(teacher.dedup_stats.format())
 
-        # Cleanup temp files
-        for temp_path in pdf_paths:
-            try:
-                os.remove(temp_path)
-            except Exception as e:
-                st.warning(f"Could not delete temporary file: {e}")
+        # Ingestion keeps running in the background while the chat stays usable
+        queue = get_job_queue()
+        for index_key in teacher.pending.values():
+            job = queue.get(index_key)
+            if job is not None:
+                st.sidebar.progress(job.progress, text=job.message)
 
     # Chat interface
     st.subheader("Chat with the Teacher")
@@ -93,17 +275,28 @@ def main():
         if "chat_history" not in st.session_state:
             st.session_state["chat_history"] = []
 
+        # Display chat messages in order (top to bottom)
+        for role, message in st.session_state["chat_history"]:
+            st.chat_message(role).write(message)
+
         user_input = st.chat_input("Ask your question")
         if user_input:
+            st.chat_message("user").write(user_input)
+            # Stream the answer into the chat, then record the finished turn
+            placeholder = st.chat_message("assistant").empty()
+            response = teacher.guide_student(user_input, stream_to=placeholder)
+            placeholder.markdown(response)
+            if teacher.turn_tokens:
+                st.caption(f"Prompt tokens this turn: {teacher.turn_tokens[-1]['prompt']:,}")
             st.session_state["chat_history"].append(("user", user_input))
-            response = teacher.guide_student(user_input)
             st.session_state["chat_history"].append(("assistant", response))
-
-        # Display chat messages in order (top to bottom)
-        for role, message in st.session_state["chat_history"]:
-            st.chat_message(role).write(message)
     else:
         st.warning("Initialize TeacherAgent and load a knowledge base to start chatting.")
 
+    # Rerun until every queued PDF has been merged
+    if teacher and teacher.pending:
+        time.sleep(POLL_INTERVAL)
+        st.rerun()
+
 if __name__ == "__main__":
     main()
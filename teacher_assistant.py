@@ -1,70 +1,54 @@
+import openai
 import streamlit as st
 from langchain_community.utilities import WikipediaAPIWrapper
 from langchain_community.tools import WikipediaQueryRun
-import openai
-import time
+from assistant_resources import get_assistant_resources
+from assistant_runs import run_assistant
+import metrics
+from openai_clients import get_openai_client
+from wiki_lookup import get_wiki_lookup
 
 # Initialize Wikipedia tool
 wiki_wrapper = WikipediaAPIWrapper(top_k_results=1, doc_content_chars_max=1000)
 wiki_tool = WikipediaQueryRun(api_wrapper=wiki_wrapper)
 
-# Initialize OpenAI Client
-def initialize_openai_client(api_key):
-    return openai.OpenAI(api_key=api_key)
-
-def analyze_data_with_openai(file, client, user_prompt):
-    # Step 1: Upload file to OpenAI
-    uploaded_file = client.files.create(file=open(file, "rb"), purpose="assistants")
-
-    # Step 2: Create Assistant
-    assistant = client.beta.assistants.create(
-        name="Data Analyst Assistant",
-        instructions="You are a personal Data Analyst Assistant",
-        model="gpt-4-1106-preview",
-        tools=[{"type": "code_interpreter"}],
-        tool_resources={"code_interpreter": {"file_ids": [uploaded_file.id]}},
-    )
-
-    # Step 3: Create Thread
-    thread = client.beta.threads.create()
-
-    # Step 4: Add Message and Run Analysis
-    client.beta.threads.messages.create(
-        thread_id=thread.id,
-        role="user",
-        content=user_prompt,
-    )
-
-    run = client.beta.threads.runs.create(
-        thread_id=thread.id,
-        assistant_id=assistant.id,
-        instructions=user_prompt,
-    )
-
-    # Wait for run to complete
-    while True:
-        time.sleep(5)
-        run_status = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-
-        if run_status.status == "completed":
-            break
-        elif run_status.status in ["failed", "cancelled", "expired"]:
-            return [{"type": "error", "value": f"Run ended with status: {run_status.status}"}]
-
-    # Process completed results
-    messages = client.beta.threads.messages.list(thread_id=thread.id)
-    results = []
-    for message in reversed(list(messages)):
-        for content in message.content:
-            if content.type == "text":
-                results.append({"type": "text", "value": content.text.value})
-
-            elif content.type == "image_file":
-                # Process image content in memory
-                image_data = client.files.content(content.image_file.file_id)
-                image_bytes = image_data.read()
-                results.append({"type": "image", "value": image_bytes})
-    return results
+# Cached, concurrent lookups shared by all sessions; the tool above is the fallback
+wiki_lookup = get_wiki_lookup(top_k=1, chars_max=1000, fallback=wiki_tool.run)
+
+ASSISTANT_MODEL = "gpt-4-1106-preview"
+ASSISTANT_INSTRUCTIONS = "You are a personal Data Analyst Assistant"
+
+def analyze_data_with_openai(file, client, user_prompt, on_text=None, on_image=None):
+    resources = get_assistant_resources()
+    resources.cleanup(client)
+
+    for attempt in range(2):
+        # Step 1: Upload file to OpenAI, once per distinct file content
+        file_id = resources.file_id(client, file.name, file.getbuffer())
+
+        # Step 2: Reuse the assistant for this model and instructions
+        assistant_id = resources.assistant_id(client, ASSISTANT_MODEL, ASSISTANT_INSTRUCTIONS)
+
+        thread_id = st.session_state.get("analysis_thread_id")
+        try:
+            # Step 3: Reuse this session's thread while the file stays the same
+            thread_id = resources.thread_id(client, file_id, thread_id)
+            st.session_state.analysis_thread_id = thread_id
+
+            # Step 4: Add Message and Run Analysis
+            client.beta.threads.messages.create(
+                thread_id=thread_id,
+                role="user",
+                content=user_prompt,
+            )
+
+            # Step 5: Stream the run's output to the page as it arrives
+            return run_assistant(client, thread_id, assistant_id, user_prompt, on_text=on_text, on_image=on_image)
+        except openai.NotFoundError:
+            if attempt:
+                raise
+            # Deleted remotely, e.g. by another process's cleanup pass; recreate once
+            resources.discard(file_id, assistant_id, thread_id)
 
 
 # Custom CSS to fix chat input at bottom
@@ -118,7 +102,8 @@ if option == "Wikipedia Search":
 
             with st.spinner("Searching Wikipedia..."):
                 try:
-                    result = wiki_tool.run(query)
+                    with metrics.span("wiki_lookup"):
+                        result = wiki_lookup.lookup(query)
                     st.session_state.wiki_messages.append({"role": "assistant", "content": result})
                     st.chat_message("assistant").markdown(f"**Assistant**: {result}")
                 except Exception as e:
@@ -135,17 +120,21 @@ elif option == "Data Analysis":
     uploaded_file = st.sidebar.file_uploader("Upload a .csv or .xlsx file", type=["csv", "xlsx"])
 
     if uploaded_file and api_key:
-        import pandas as pd
+        from dataset_cache import get_dataset_cache
 
-        # Display the first 5 rows of the uploaded file
+        # Display the first 5 rows of the uploaded file. The upload is converted to
+        # Parquet once; reruns reuse the cached info and only read the preview rows.
         try:
-            if uploaded_file.name.endswith(".csv"):
-                data = pd.read_csv(uploaded_file)
-            elif uploaded_file.name.endswith(".xlsx"):
-                data = pd.read_excel(uploaded_file)
+            dataset_cache = get_dataset_cache()
+            cached = st.session_state.get("analysis_dataset")
+            if not cached or cached[0] != uploaded_file.file_id:
+                cached = (uploaded_file.file_id, dataset_cache.ingest(uploaded_file.name, uploaded_file.getbuffer()))
+                st.session_state.analysis_dataset = cached
+            dataset_info = cached[1]
 
             st.subheader("Preview of Uploaded File")
-            st.dataframe(data.head(5))
+            st.dataframe(dataset_cache.preview(dataset_info, rows=5))
+            st.caption(f"{dataset_info.num_rows:,} rows × {len(dataset_info.columns)} columns")
         except Exception as e:
             st.error(f"Could not read the file: {e}")
 
@@ -168,18 +157,28 @@ elif option == "Data Analysis":
             with main_container:
                 st.chat_message("user").markdown(f"**User**: {prompt}")
 
+                # Render text deltas and images as they arrive
+                placeholders = {}
+
+                def show_text(key, text):
+                    if key not in placeholders:
+                        placeholders[key] = st.chat_message("assistant").empty()
+                    placeholders[key].markdown(f"**Assistant**: {text}")
+
+                def show_image(image_bytes):
+                    st.chat_message("assistant").image(image_bytes, caption="Assistant Generated Image")
+
                 with st.spinner("Analyzing data..."):
                     try:
-                        client = initialize_openai_client(api_key)
-                        results = analyze_data_with_openai(uploaded_file.name, client, prompt)
+                        # One pooled client per API key, shared by every session
+                        client = get_openai_client(api_key)
+                        results = analyze_data_with_openai(uploaded_file, client, prompt, show_text, show_image)
 
                         for result in results:
-                            if result["type"] == "text":
-                                st.session_state.analysis_messages.append({"role": "assistant", "content": result["value"]})
-                                st.chat_message("assistant").markdown(f"**Assistant**: {result['value']}")
-                            elif result["type"] == "image":
+                            if result["type"] in ("text", "image"):
                                 st.session_state.analysis_messages.append({"role": "assistant", "content": result["value"]})
-                                st.chat_message("assistant").image(result["value"], caption="Assistant Generated Image")
+                            elif result["type"] == "error":
+                                st.error(result["value"])
                     except Exception as e:
                         st.error(f"An error occurred: {e}")
     elif not api_key:
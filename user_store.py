@@ -0,0 +1,135 @@
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextlib import contextmanager
+
+import bcrypt
+
+import metrics
+from storage import singleton
+
+DB_PATH = "users.db"
+
+# Connections kept open per process, and the bcrypt worker / queue limits.
+# bcrypt releases the GIL, so a few workers run in parallel; once
+# BCRYPT_MAX_PENDING calls are queued, new logins are refused as busy
+# instead of piling up on the server.
+POOL_SIZE = 8
+BCRYPT_WORKERS = 4
+BCRYPT_MAX_PENDING = 64
+BCRYPT_TIMEOUT = 15
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        username TEXT NOT NULL,
+        email TEXT PRIMARY KEY,
+        password TEXT NOT NULL
+    )
+"""
+# Statements are kept as constants so sqlite3's per-connection statement
+# cache reuses the prepared statement on every call
+INSERT_USER = "INSERT INTO users (username, email, password) VALUES (?, ?, ?)"
+SELECT_USER = "SELECT username, password FROM users WHERE email = ?"
+
+
+class ServerBusy(Exception):
+    """Raised when the bcrypt pool is saturated."""
+
+
+class UserStore:
+    """SQLite user table behind a small per-process connection pool in WAL mode."""
+
+    def __init__(self, path=DB_PATH, pool_size=POOL_SIZE):
+        self.path = path
+        self._pool = queue.LifoQueue()
+        self._created = 0
+        self._pool_size = pool_size
+        self._lock = threading.Lock()
+        # Schema setup runs once per process, not on every rerun
+        with self.connection() as conn:
+            conn.execute(SCHEMA)
+            conn.commit()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, cached_statements=32)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        conn = None
+        with self._lock:
+            if self._pool.empty() and self._created < self._pool_size:
+                self._created += 1
+                conn = self._connect()
+        if conn is None:
+            conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def add_user(self, username, email, hashed_password):
+        with self.connection() as conn:
+            try:
+                conn.execute(INSERT_USER, (username, email, hashed_password))
+                conn.commit()
+                return True
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                return False
+
+    def get_user(self, email):
+        with self.connection() as conn:
+            return conn.execute(SELECT_USER, (email,)).fetchone()
+
+
+_bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_bcrypt_slots = threading.BoundedSemaphore(BCRYPT_MAX_PENDING)
+
+
+def _run_bcrypt(fn, *args):
+    if not _bcrypt_slots.acquire(blocking=False):
+        metrics.count("bcrypt_rejected", reason="busy")
+        raise ServerBusy("Too many logins in progress")
+    future = _bcrypt_executor.submit(fn, *args)
+    future.add_done_callback(lambda _: _bcrypt_slots.release())
+    try:
+        # Includes the wait for a free worker, as the user experiences it
+        with metrics.span("bcrypt", op=fn.__name__):
+            return future.result(timeout=BCRYPT_TIMEOUT)
+    except TimeoutError:
+        metrics.count("bcrypt_rejected", reason="timeout")
+        raise ServerBusy("Password check timed out")
+
+
+def hash_password(password):
+    return _run_bcrypt(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+
+def check_password(password, hashed_password):
+    return _run_bcrypt(bcrypt.checkpw, password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+def get_user_store(path=DB_PATH):
+    return singleton(("user_store", path), lambda: UserStore(path))
+
+
+def add_user(username, email, hashed_password):
+    return get_user_store().add_user(username, email, hashed_password)
+
+
+def validate_user(email, password):
+    user = get_user_store().get_user(email)
+
+    if not user:
+        return "email_not_found", None
+
+    try:
+        if check_password(password, user[1]):
+            return "success", user[0]
+    except ServerBusy:
+        return "busy", None
+    return "invalid_password", None
@@ -0,0 +1,235 @@
+"""FAISS index backends sized to the corpus.
+
+Small corpora keep the exact flat index. Larger ones are rebuilt as IVF
+indexes with 8-bit scalar or product quantization, or as HNSW graphs, with
+list counts, training sample size and PQ sub-quantizers derived from the
+corpus size and vector dimension. Stores are always built flat first, so the
+flat vectors double as the recall baseline.
+"""
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+import metrics
+
+# One of: auto, flat, ivf, ivf_sq8, ivf_pq, hnsw, hnsw_sq8
+FAISS_BACKEND = os.environ.get("DATACHAT_FAISS_BACKEND", "auto")
+
+# Corpus sizes at which "auto" switches to IVF with scalar, then product, quantization
+FLAT_MAX_VECTORS = 20000
+PQ_MIN_VECTORS = 200000
+
+# FAISS wants about 39 training points per inverted list
+MIN_POINTS_PER_LIST = 39
+TRAINING_POINTS_PER_LIST = 64
+HNSW_NEIGHBORS = 32
+
+
+def choose_backend(n_vectors, backend=FAISS_BACKEND, mutable=False):
+    """Backend for a corpus of ``n_vectors``.
+
+    Mutable stores need vector removal, which HNSW does not support, so HNSW
+    requests fall back to the matching IVF backend for them.
+    """
+    if backend == "auto":
+        if n_vectors < FLAT_MAX_VECTORS:
+            return "flat"
+        return "ivf_sq8" if n_vectors < PQ_MIN_VECTORS else "ivf_pq"
+    if mutable and backend.startswith("hnsw"):
+        return "ivf_sq8" if backend == "hnsw_sq8" else "ivf"
+    return backend
+
+
+def backend_of(index):
+    if isinstance(index, faiss.IndexFlat):
+        return "flat"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVFScalarQuantizer):
+        return "ivf_sq8"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf"
+    if isinstance(index, faiss.IndexHNSWSQ):
+        return "hnsw_sq8"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    return type(index).__name__
+
+
+def _pq_subquantizers(dim):
+    # Largest sub-quantizer count up to 64 that divides the dimension,
+    # keeping at least 8 dimensions per sub-vector
+    for m in (64, 48, 32, 24, 16, 12, 8, 6, 4, 2, 1):
+        if dim % m == 0 and dim // m >= 8:
+            return m
+    return 1
+
+
+def build_index(vectors, backend):
+    """Train (where needed) and fill a new index of ``backend`` with ``vectors``."""
+    n_vectors, dim = vectors.shape
+    if backend == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif backend.startswith("hnsw"):
+        if backend == "hnsw_sq8":
+            index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, HNSW_NEIGHBORS)
+        else:
+            index = faiss.IndexHNSWFlat(dim, HNSW_NEIGHBORS)
+        index.hnsw.efConstruction = 80
+        index.hnsw.efSearch = 64
+    else:
+        n_lists = max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // MIN_POINTS_PER_LIST))
+        quantizer = faiss.IndexFlatL2(dim)
+        if backend == "ivf_pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, n_lists, _pq_subquantizers(dim), 8)
+        elif backend == "ivf_sq8":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, n_lists, faiss.ScalarQuantizer.QT_8bit)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, n_lists)
+        # Probe about 1/16 of the lists, at least 8
+        index.nprobe = min(n_lists, max(8, n_lists // 16))
+
+    if not index.is_trained:
+        n_train = min(n_vectors, max(256, TRAINING_POINTS_PER_LIST * getattr(index, "nlist", 1)))
+        sample = vectors[np.random.default_rng(0).choice(n_vectors, n_train, replace=False)]
+        index.train(sample)
+    index.add(vectors)
+    return index
+
+
+def index_bytes(index):
+    """Approximate memory held by ``index``, from its sizes rather than a serialized copy."""
+    if isinstance(index, faiss.IndexHNSW):
+        # Stored codes plus the base layer's neighbour links
+        return index.ntotal * (index.storage.sa_code_size() + 4 * index.hnsw.nb_neighbors(0))
+    if isinstance(index, faiss.IndexIVF):
+        # Codes and ids in the inverted lists, plus the coarse centroids
+        size = index.ntotal * (index.code_size + 8) + index.nlist * index.d * 4
+        if isinstance(index, faiss.IndexIVFPQ):
+            size += index.pq.M * index.pq.ksub * index.pq.dsub * 4
+        return size
+    return index.ntotal * index.sa_code_size()
+
+
+def _flat_vectors(index):
+    # A view of the flat index's own storage, so the vectors are not copied
+    return faiss.rev_swig_ptr(index.get_xb(), index.ntotal * index.d).reshape(index.ntotal, index.d)
+
+
+def evaluate_index(flat, index, k=4, n_queries=100):
+    """Recall@k and mean query latency of ``index`` against exact search on the ``flat`` index it replaces.
+
+    Queries are a sample of the stored vectors, so no second copy of the
+    corpus is needed.
+    """
+    rng = np.random.default_rng(1)
+    sample = rng.choice(flat.ntotal, min(n_queries, flat.ntotal), replace=False)
+    queries = flat.reconstruct_batch(sample.astype(np.int64))
+    # Perturb the queries so they are not exact corpus points
+    queries = queries + rng.normal(0, 0.01, queries.shape).astype(np.float32)
+
+    start = time.perf_counter()
+    _, expected = flat.search(queries, k)
+    flat_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    index_seconds = time.perf_counter() - start
+
+    hits = sum(len(set(e) & set(f)) for e, f in zip(expected, found))
+    return {
+        "backend": backend_of(index),
+        "vectors": flat.ntotal,
+        f"recall_at_{k}": round(hits / (len(queries) * k), 4),
+        "flat_query_ms": round(flat_seconds * 1000 / len(queries), 4),
+        "index_query_ms": round(index_seconds * 1000 / len(queries), 4),
+        "flat_bytes": index_bytes(flat),
+        "index_bytes": index_bytes(index),
+    }
+
+
+def format_report(report):
+    return (
+        f"Index: {report['backend']}, recall@4 {report['recall_at_4']:.0%} vs flat, "
+        f"{report['index_query_ms']:.2f} ms/query vs {report['flat_query_ms']:.2f} ms, "
+        f"{report['index_bytes'] / 2**20:.0f} MB vs {report['flat_bytes'] / 2**20:.0f} MB"
+    )
+
+
+def optimize_vectorstore(vectorstore, backend=FAISS_BACKEND, mutable=False, evaluate=True):
+    """Swap a flat store's index for the backend suited to its size.
+
+    Only flat indexes are converted, since they hold the exact vectors. Ids
+    are kept because vectors are re-added in the same order. Returns the
+    evaluation report, or None when the index was left unchanged.
+    """
+    index = vectorstore.index
+    target = choose_backend(index.ntotal, backend, mutable)
+    if backend_of(index) != "flat" or target == "flat" or index.ntotal == 0:
+        return None
+
+    with metrics.span("index_optimize", backend=target):
+        new_index = build_index(_flat_vectors(index), target)
+    report = evaluate_index(index, new_index) if evaluate else None
+    vectorstore.index = new_index
+    return report
+
+
+def merge_into(target, source):
+    """Add all of ``source``'s documents and vectors to ``target``, keeping docstore ids.
+
+    FAISS can only merge indexes of the same type; otherwise the source
+    vectors are re-added, which works for any trained target index.
+    """
+    if backend_of(target.index) == backend_of(source.index) == "flat":
+        target.merge_from(source)
+        return
+    vectors = source.index.reconstruct_n(0, source.index.ntotal)
+    ids = [source.index_to_docstore_id[i] for i in range(source.index.ntotal)]
+    documents = [source.docstore.search(doc_id) for doc_id in ids]
+    target.add_embeddings(
+        [(doc.page_content, vector) for doc, vector in zip(documents, vectors.tolist())],
+        metadatas=[doc.metadata for doc in documents],
+        ids=ids,
+    )
+
+
+def remove_documents(vectorstore, doc_ids):
+    """Remove documents by docstore id, for any index backend.
+
+    LangChain's FAISS.delete assumes labels are renumbered after removal, as
+    the flat index does. IVF indexes keep their labels, so instead the kept
+    vectors are decoded and re-added to an emptied copy of the trained index.
+    """
+    index = vectorstore.index
+    if backend_of(index) == "flat":
+        vectorstore.delete(doc_ids)
+        return
+
+    removed = set(doc_ids)
+    keep = [i for i in range(index.ntotal) if vectorstore.index_to_docstore_id[i] not in removed]
+    index.make_direct_map()
+    vectors = index.reconstruct_batch(np.array(keep, dtype=np.int64)) if keep else None
+    new_index = faiss.clone_index(index)
+    new_index.reset()
+    if keep:
+        new_index.add(vectors)
+
+    vectorstore.docstore.delete([doc_id for doc_id in doc_ids if doc_id in vectorstore.docstore._dict])
+    vectorstore.index_to_docstore_id = {
+        new_label: vectorstore.index_to_docstore_id[old_label] for new_label, old_label in enumerate(keep)
+    }
+    vectorstore.index = new_index
+
+
+def copy_vectorstore(vectorstore):
+    """Independent copy of a store, so a shared one can be merged into or deleted from safely."""
+    return type(vectorstore)(
+        vectorstore.embedding_function,
+        faiss.clone_index(vectorstore.index),
+        InMemoryDocstore(dict(vectorstore.docstore._dict)),
+        dict(vectorstore.index_to_docstore_id),
+    )
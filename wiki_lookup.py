@@ -0,0 +1,160 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+
+import metrics
+from sqlite_cache import SqliteCache
+from storage import cache_dir, singleton
+
+# MediaWiki endpoint; point it at a local stub for tests
+WIKI_API_URL = os.environ.get("DATACHAT_WIKI_API_URL", "https://en.wikipedia.org/w/api.php")
+# Set to 0 to keep lookups in memory only
+WIKI_DISK_CACHE = os.environ.get("DATACHAT_WIKI_DISK_CACHE", "1") == "1"
+
+CACHE_TTL = 24 * 60 * 60
+# Empty searches are kept briefly, in memory only
+NO_RESULT_TTL = 10 * 60
+MEMORY_ENTRIES = 1024
+DISK_ENTRIES = 50000
+REQUEST_TIMEOUT = 5.0
+
+NO_RESULT = "No good Wikipedia Search Result was found"
+
+
+def normalize_query(query):
+    """Lowercase, collapse whitespace and drop trailing punctuation, so near-identical queries share a cache entry.
+
+    Other symbols are kept: "c++", "c#" and "f#" are different topics.
+    """
+    return " ".join(query.lower().split()).rstrip("?!.,;: ")
+
+
+class TTLCache:
+    """In-memory LRU with per-entry expiry."""
+
+    def __init__(self, max_entries=MEMORY_ENTRIES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+async def fetch_articles(query, top_k=1, chars_max=1000, api_url=WIKI_API_URL, timeout=REQUEST_TIMEOUT):
+    """Search Wikipedia and fetch the top ``top_k`` article summaries in parallel.
+
+    Every HTTP request is bounded by ``timeout``. Returns the text, in
+    WikipediaAPIWrapper's format, and whether every request succeeded;
+    articles that fail or time out are left out, and if all of them do the
+    first error is raised.
+    """
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        search = await client.get(api_url, params={
+            "action": "query", "list": "search", "srsearch": query, "srlimit": top_k, "format": "json",
+        })
+        search.raise_for_status()
+        titles = [hit["title"] for hit in search.json().get("query", {}).get("search", [])][:top_k]
+
+        async def fetch_summary(title):
+            response = await client.get(api_url, params={
+                "action": "query", "prop": "extracts", "exintro": 1, "explaintext": 1,
+                "redirects": 1, "titles": title, "format": "json",
+            })
+            response.raise_for_status()
+            pages = response.json().get("query", {}).get("pages", {})
+            return next((page.get("extract", "") for page in pages.values()), "")
+
+        summaries = await asyncio.gather(*(fetch_summary(title) for title in titles), return_exceptions=True)
+
+    errors = [summary for summary in summaries if isinstance(summary, BaseException)]
+    if titles and len(errors) == len(titles):
+        raise errors[0]
+    articles = [
+        f"Page: {title}\nSummary: {summary}"
+        for title, summary in zip(titles, summaries)
+        if isinstance(summary, str) and summary
+    ]
+    if not articles:
+        return NO_RESULT, not errors
+    return "\n\n".join(articles)[:chars_max], not errors
+
+
+class WikiLookup:
+    """Cached Wikipedia lookups: memory LRU first, then the shared disk store, then the network."""
+
+    def __init__(self, top_k=1, chars_max=1000, ttl=CACHE_TTL, disk_cache=WIKI_DISK_CACHE,
+                 api_url=WIKI_API_URL, timeout=REQUEST_TIMEOUT, fallback=None):
+        self.top_k = top_k
+        self.chars_max = chars_max
+        self.api_url = api_url
+        self.timeout = timeout
+        # Synchronous lookup used when the async path fails, e.g. a WikipediaQueryRun's run
+        self.fallback = fallback
+        self.memory = TTLCache(ttl=ttl)
+        self.disk = SqliteCache(os.path.join(cache_dir("wikipedia"), "lookups.sqlite"),
+                                max_entries=DISK_ENTRIES, ttl=ttl) if disk_cache else None
+
+    def _key(self, query):
+        return f"{self.top_k}:{self.chars_max}:{normalize_query(query)}"
+
+    def lookup(self, query):
+        key = self._key(query)
+        result = self.memory.get(key)
+        if result is None and self.disk is not None:
+            result = self.disk.get(key)
+            if result is not None:
+                self.memory.set(key, result)
+        metrics.cache_result("wikipedia", result is not None)
+        if result is not None:
+            return result
+
+        try:
+            with metrics.span("wiki_fetch"):
+                result, complete = asyncio.run(
+                    fetch_articles(query, self.top_k, self.chars_max, self.api_url, self.timeout)
+                )
+        except Exception:
+            metrics.count("wiki_fallbacks")
+            if self.fallback is None:
+                raise
+            result, complete = self.fallback(query), False
+
+        if not complete:
+            # Some requests failed; ask the network again next time
+            return result
+        if result == NO_RESULT:
+            self.memory.set(key, result, ttl=NO_RESULT_TTL)
+            return result
+        self.memory.set(key, result)
+        if self.disk is not None:
+            self.disk.set(key, result)
+        return result
+
+
+def get_wiki_lookup(top_k=1, chars_max=1000, fallback=None):
+    """Shared lookup for these settings; ``fallback`` is taken from the first caller."""
+    return singleton(
+        ("wiki_lookup", top_k, chars_max),
+        lambda: WikiLookup(top_k=top_k, chars_max=chars_max, fallback=fallback),
+    )